@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import json
 from typing import Dict
 
+import orjson
+
 from app.core.logging import get_logger
 from app.llm.provider import BaseLLMProvider
 
@@ -24,10 +25,11 @@ class CoderAgent:
         step: Dict[str, str],
         *,
         messages: list[Dict[str, str]] | None = None,
-        model: str | None = None
+        model: str | None = None,
+        output_token_budget: int | None = None
     ) -> Dict[str, str]:
         if messages is None:
-            context = json.dumps({"task": task, "step": step}, ensure_ascii=False, indent=2)
+            context = orjson.dumps({"task": task, "step": step}, option=orjson.OPT_INDENT_2).decode()
             prompt = build_prompt(self.spec.section("CODER-AI"), context)
             messages = [{"role": "system", "content": prompt}]
 
@@ -35,7 +37,8 @@ class CoderAgent:
         selected_model = model or self.model
 
         logger.info("coder_step_request", model=selected_model, step=step.get("title"))
-        response = await self.provider.generate(model=selected_model, messages=messages)
+        kwargs = {} if output_token_budget is None else {"output_token_budget": output_token_budget}
+        response = await self.provider.generate(model=selected_model, messages=messages, **kwargs)
         if self.dry_run:
             logger.info("coder_step_dry_run")
             return {
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import hashlib
+import os
+import time
 from pathlib import Path
 from typing import Dict
 
 from app.core.logging import get_logger
+from app.llm.provider import PROMPT_CACHE_BREAKPOINT
 
 logger = get_logger(__name__)
 
@@ -21,10 +24,33 @@ class AgentsSpec:
         return self.sections[key]
 
 
+# AGENTS.md is stat'ed at most this often; it is only re-read when its mtime changes
+AGENTS_RECHECK_SECONDS = 5.0
+
+# absolute path -> (mtime_ns, last checked, parsed spec)
+_agents_cache: Dict[str, tuple[int, float, AgentsSpec]] = {}
+
+
 def parse_agents_file(path: Path = Path("AGENTS.md")) -> AgentsSpec:
-    if not path.exists():
-        raise FileNotFoundError("AGENTS.md not found")
-    content = path.read_text(encoding="utf-8")
+    key = os.path.abspath(path)
+    now = time.monotonic()
+    cached = _agents_cache.get(key)
+    if cached is not None and now - cached[1] < AGENTS_RECHECK_SECONDS:
+        return cached[2]
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        _agents_cache.pop(key, None)
+        raise FileNotFoundError("AGENTS.md not found") from None
+    if cached is not None and cached[0] == mtime_ns:
+        spec = cached[2]
+    else:
+        spec = _parse_agents_content(path.read_text(encoding="utf-8"))
+    _agents_cache[key] = (mtime_ns, now, spec)
+    return spec
+
+
+def _parse_agents_content(content: str) -> AgentsSpec:
     digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
     sections: Dict[str, str] = {}
     current_header = None
@@ -44,6 +70,7 @@ def parse_agents_file(path: Path = Path("AGENTS.md")) -> AgentsSpec:
 
 
 def build_prompt(section_text: str, context: str) -> str:
-    prompt = f"{section_text}\n\nContext:\n{context.strip()}"
+    # Static section first so providers can cache it as a shared prompt prefix
+    prompt = f"{section_text}{PROMPT_CACHE_BREAKPOINT}{context.strip()}"
     logger.debug("prompt_built", prompt_length=len(prompt))
     return prompt
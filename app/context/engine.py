@@ -199,7 +199,8 @@ class ContextEngine:
             tokens_used += current.tokens
         hints = self.curator_agent.build_hints(query, selected)
         context_message = self._build_context_message(selected, hints)
-        messages = [context_message] + base_messages
+        # Agent prompts go first so their static prefix stays cacheable across calls
+        messages = base_messages + [context_message]
         tokens_final = self.provider.count_tokens(messages)
         hard_cap = self.settings.context_hard_cap_tokens
         dropped: List[RankedCandidate] = []
@@ -209,7 +210,7 @@ class ContextEngine:
             tokens_clipped += removed.tokens
             hints = self.curator_agent.build_hints(query, selected)
             context_message = self._build_context_message(selected, hints)
-            messages = [context_message] + base_messages
+            messages = base_messages + [context_message]
             tokens_final = self.provider.count_tokens(messages)
         diagnostics = {
             "job_id": job_id,
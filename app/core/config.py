@@ -52,9 +52,12 @@ class AppSettings(BaseSettings):
     routing_complexity_threshold_complex: int = Field(7, alias="ROUTING_COMPLEXITY_THRESHOLD_COMPLEX")
     routing_token_threshold_large: int = Field(5000, alias="ROUTING_TOKEN_THRESHOLD_LARGE")
     routing_fallback_model: str = Field("gpt-4", alias="ROUTING_FALLBACK_MODEL")
+    max_concurrent_llm: int = Field(4, alias="MAX_CONCURRENT_LLM")
+    llm_request_coalescing_enabled: bool = Field(True, alias="LLM_REQUEST_COALESCING_ENABLED")
 
     # Budget Guards
     budget_hard_stop_threshold: float = Field(0.9, alias="BUDGET_HARD_STOP_THRESHOLD")
+    stream_with_budget_cancel: bool = Field(False, alias="STREAM_WITH_BUDGET_CANCEL")
 
     # Loop Detection
     max_step_retries: int = Field(3, alias="MAX_STEP_RETRIES")
@@ -64,6 +67,10 @@ class AppSettings(BaseSettings):
     # Stall Detection
     stall_timeout_minutes: int = Field(30, alias="STALL_TIMEOUT_MINUTES")
 
+    # LLM Response Cache
+    llm_response_cache_enabled: bool = Field(False, alias="LLM_RESPONSE_CACHE_ENABLED")
+    llm_response_cache_ttl_seconds: int = Field(86400, alias="LLM_RESPONSE_CACHE_TTL_SECONDS")
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="allow")
 
     @property
@@ -1,14 +1,21 @@
 from __future__ import annotations
 
 import difflib
+import os
 import re
+import shutil
+import tempfile
 from pathlib import Path
-from typing import Iterable, Tuple
+from typing import Iterable, Iterator, List, Tuple, Union
 
 from .logging import get_logger
 
 logger = get_logger(__name__)
 
+# Read once at import, while nothing else can race the set-and-restore
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 HUNK_RE = re.compile(r"@@ -(?P<old_start>\d+)(?:,(?P<old_len>\d+))? \+(?P<new_start>\d+)(?:,(?P<new_len>\d+))? @@")
 
 
@@ -22,7 +29,7 @@ def generate_unified_diff(original: str, updated: str, filename: str) -> str:
     return "".join(diff)
 
 
-def apply_unified_diff(base_path: Path, diff_text: str) -> Iterable[Tuple[Path, str]]:
+def apply_unified_diff(base_path: Path, diff_text: str) -> Iterator[Tuple[Path, Iterable[str]]]:
     lines = diff_text.splitlines()
     i = 0
     while i < len(lines):
@@ -90,16 +97,46 @@ def apply_unified_diff(base_path: Path, diff_text: str) -> Iterable[Tuple[Path,
                 )
 
             rebuilt.extend(source_lines[cursor:])
-            new_content = "\n".join(rebuilt)
-            if original_content.endswith("\n") or diff_text.endswith("\n"):
-                new_content += "\n"
+            trailing_newline = original_content.endswith("\n") or diff_text.endswith("\n")
             logger.info("diff_applied", path=str(target_path), lines=len(rebuilt))
-            yield target_path, new_content
+            # Content is streamed line by line instead of joined into one more copy of the file
+            yield target_path, _iter_content(rebuilt, trailing_newline)
         else:
             i += 1
 
 
-def safe_write(path: Path, content: str) -> None:
+def _iter_content(lines: List[str], trailing_newline: bool) -> Iterator[str]:
+    """Yield the chunks of "\n".join(lines), plus a final newline if requested."""
+    last = len(lines) - 1
+    for index, line in enumerate(lines):
+        yield line + "\n" if index < last or trailing_newline else line
+    if not lines and trailing_newline:
+        yield "\n"
+
+
+def safe_write(path: Path, content: Union[str, Iterable[str]]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(content, encoding="utf-8")
+    chunks = (content,) if isinstance(content, str) else content
+    # Write beside the target and swap it in, so a failed write never leaves a truncated file.
+    # The temp name is unique: a fixed "<name>.tmp" could clobber a file the repo tracks.
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    ) as handle:
+        tmp_path = Path(handle.name)
+        try:
+            handle.writelines(chunks)
+        except BaseException:
+            handle.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    try:
+        if path.exists():
+            shutil.copymode(path, tmp_path)
+        else:
+            # Temp files are created 0600; give new files the mode open() would have
+            tmp_path.chmod(0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     logger.info("file_written", path=str(path))
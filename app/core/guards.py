@@ -1,16 +1,28 @@
 from __future__ import annotations
 
+import bisect
+import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from enum import Enum
+from functools import cached_property, lru_cache
 from typing import Optional
 
-from app.core.config import get_settings
+from app.core.config import AppSettings, get_settings
 from app.core.logging import get_logger
 from app.db.models import JobModel, JobStepModel
 
 logger = get_logger(__name__)
 
+# Number of recent file edits kept per step
+EDIT_HISTORY_LIMIT = 20
+
+
+@lru_cache(maxsize=64)
+def _minutes(minutes: int) -> timedelta:
+    """Shared timedelta per distinct minute limit (jobs reuse a handful of values)."""
+    return timedelta(minutes=minutes)
+
 
 class BudgetStatus(Enum):
     """Budget utilization status levels"""
@@ -31,7 +43,10 @@ class LoopStatus(Enum):
     FILE_LOOP_DETECTED = "file_loop_detected"  # 5+ same file edits
 
 
-@dataclass
+_BLOCKING_STATUSES = frozenset({BudgetStatus.CRITICAL_90, BudgetStatus.EXCEEDED})
+
+
+@dataclass(slots=True, frozen=True)
 class BudgetCheckResult:
     """Result of budget check"""
 
@@ -42,7 +57,7 @@ class BudgetCheckResult:
     should_block: bool
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LoopCheckResult:
     """Result of loop detection check"""
 
@@ -52,11 +67,44 @@ class LoopCheckResult:
     reason: str
 
 
+@dataclass(slots=True, frozen=True)
+class GuardResult:
+    """Combined result of all guard checks for one step"""
+
+    stalled: bool
+    budget: BudgetCheckResult
+    loop: Optional[LoopCheckResult] = None
+
+
 class BudgetGuard:
     """Guards against budget overruns with progressive warnings"""
 
-    def __init__(self):
-        self.settings = get_settings()
+    @cached_property
+    def settings(self) -> AppSettings:
+        return get_settings()
+
+    @cached_property
+    def _status_table(self) -> tuple[list[float], list[BudgetStatus]]:
+        """
+        Sorted (thresholds, statuses) lookup table for bisect.
+
+        statuses[i] applies to utilization in [thresholds[i-1], thresholds[i]).
+        Warning levels at or above the hard-stop threshold are dropped so the
+        hard stop always wins, matching the precedence of the old if/elif ladder.
+        """
+        hard_stop = min(self.settings.budget_hard_stop_threshold, 1.0)
+        thresholds: list[float] = []
+        statuses = [BudgetStatus.OK]
+        for threshold, status in ((0.5, BudgetStatus.WARNING_50), (0.75, BudgetStatus.WARNING_75)):
+            if threshold < hard_stop:
+                thresholds.append(threshold)
+                statuses.append(status)
+        if hard_stop < 1.0:
+            thresholds.append(hard_stop)
+            statuses.append(BudgetStatus.CRITICAL_90)
+        thresholds.append(1.0)
+        statuses.append(BudgetStatus.EXCEEDED)
+        return thresholds, statuses
 
     def check_budget(self, job: JobModel, estimated_step_cost: float = 0.0) -> BudgetCheckResult:
         """
@@ -69,6 +117,23 @@ class BudgetGuard:
         Returns:
             BudgetCheckResult with current status and recommendations
         """
+        result = self._evaluate(job, estimated_step_cost)
+
+        # Skip the percentage/currency formatting entirely when INFO is filtered out
+        if logger.is_enabled_for(logging.INFO):
+            logger.info(
+                "budget_check",
+                job_id=job.id,
+                status=result.status.value,
+                budget_used_pct=f"{result.budget_used_pct:.1%}",
+                remaining_usd=f"${result.remaining_usd:.2f}",
+                should_block=result.should_block,
+            )
+
+        return result
+
+    def _evaluate(self, job: JobModel, estimated_step_cost: float) -> BudgetCheckResult:
+        """Compute the budget check without logging."""
         current_cost = job.cost_usd or 0.0
         projected_cost = current_cost + estimated_step_cost
         budget = job.budget_usd
@@ -77,16 +142,8 @@ class BudgetGuard:
         remaining = budget - projected_cost
 
         # Determine status
-        if budget_used_pct >= 1.0:
-            status = BudgetStatus.EXCEEDED
-        elif budget_used_pct >= self.settings.budget_hard_stop_threshold:
-            status = BudgetStatus.CRITICAL_90
-        elif budget_used_pct >= 0.75:
-            status = BudgetStatus.WARNING_75
-        elif budget_used_pct >= 0.5:
-            status = BudgetStatus.WARNING_50
-        else:
-            status = BudgetStatus.OK
+        thresholds, statuses = self._status_table
+        status = statuses[bisect.bisect_right(thresholds, budget_used_pct)]
 
         # Check if should warn (not warned before at this threshold)
         should_warn = False
@@ -98,16 +155,7 @@ class BudgetGuard:
             should_warn = True
 
         # Block if >= 90% or exceeded
-        should_block = status in [BudgetStatus.CRITICAL_90, BudgetStatus.EXCEEDED]
-
-        logger.info(
-            "budget_check",
-            job_id=job.id,
-            status=status.value,
-            budget_used_pct=f"{budget_used_pct:.1%}",
-            remaining_usd=f"${remaining:.2f}",
-            should_block=should_block,
-        )
+        should_block = status in _BLOCKING_STATUSES
 
         return BudgetCheckResult(
             status=status,
@@ -137,8 +185,9 @@ class BudgetGuard:
 class LoopDetector:
     """Detects infinite loops in job execution"""
 
-    def __init__(self):
-        self.settings = get_settings()
+    @cached_property
+    def settings(self) -> AppSettings:
+        return get_settings()
 
     def check_step_retry(self, job: JobModel, step: JobStepModel) -> LoopCheckResult:
         """
@@ -151,6 +200,24 @@ class LoopDetector:
         Returns:
             LoopCheckResult with retry count and replan recommendation
         """
+        result, consecutive = self._evaluate(job, step)
+
+        # Routine "OK" checks run every step; only actionable outcomes log at info
+        log = logger.debug if result.status is LoopStatus.OK else logger.info
+        log(
+            "loop_check_step",
+            job_id=job.id,
+            step_id=step.id,
+            status=result.status.value,
+            retry_count=result.retry_count,
+            consecutive_failures=consecutive,
+            should_replan=result.should_replan,
+        )
+
+        return result
+
+    def _evaluate(self, job: JobModel, step: JobStepModel) -> tuple[LoopCheckResult, int]:
+        """Compute the retry-loop check without logging; also returns the consecutive failure count."""
         retry_count = step.retry_count or 0
         max_retries = self.settings.max_step_retries
 
@@ -175,19 +242,10 @@ class LoopDetector:
             should_replan = False
             reason = "Normal execution"
 
-        logger.info(
-            "loop_check_step",
-            job_id=job.id,
-            step_id=step.id,
-            status=status.value,
-            retry_count=retry_count,
-            consecutive_failures=consecutive,
-            should_replan=should_replan,
-        )
-
-        return LoopCheckResult(
+        result = LoopCheckResult(
             status=status, retry_count=retry_count, should_replan=should_replan, reason=reason
         )
+        return result, consecutive
 
     def check_file_edit_loop(self, step: JobStepModel, filepath: str) -> bool:
         """
@@ -200,12 +258,10 @@ class LoopDetector:
         Returns:
             True if file edit loop detected
         """
-        edit_history = step.edit_history or []
         max_edits = self.settings.max_file_edits_per_step
 
         # Count occurrences of filepath in recent edits
-        recent_edits = edit_history[-max_edits:] if len(edit_history) > max_edits else edit_history
-        same_file_count = recent_edits.count(filepath)
+        same_file_count = (step.edit_history or [])[-max_edits:].count(filepath)
 
         is_loop = same_file_count >= max_edits
 
@@ -223,18 +279,21 @@ class LoopDetector:
             filepath: Path of edited file
             session: SQLAlchemy session
         """
-        history = list(step.edit_history or [])
-        history.append(filepath)
-        # Keep last 20 edits
-        step.edit_history = history[-20:]
+        # Assign a fresh list so SQLAlchemy detects the JSON column change
+        step.edit_history = ((step.edit_history or []) + [filepath])[-EDIT_HISTORY_LIMIT:]
         session.add(step)
 
 
 class StallDetector:
     """Detects stalled jobs"""
 
-    def __init__(self):
-        self.settings = get_settings()
+    @cached_property
+    def settings(self) -> AppSettings:
+        return get_settings()
+
+    @cached_property
+    def _stall_timeout(self) -> timedelta:
+        return _minutes(self.settings.stall_timeout_minutes)
 
     def check_job_stalled(self, job: JobModel) -> bool:
         """
@@ -246,14 +305,15 @@ class StallDetector:
         Returns:
             True if job is stalled
         """
-        if not job.started_at:
+        started_at = job.started_at
+        if not started_at:
             return False
 
         now = datetime.utcnow()
 
         # Check wall-clock timeout
-        elapsed = now - job.started_at
-        max_duration = timedelta(minutes=job.max_minutes)
+        elapsed = now - started_at
+        max_duration = _minutes(job.max_minutes)
 
         if elapsed > max_duration:
             logger.warning(
@@ -265,9 +325,9 @@ class StallDetector:
             return True
 
         # Check stall timeout (no progress in configured minutes)
-        last_progress = job.last_progress_at or job.started_at
+        last_progress = job.last_progress_at or started_at
         time_since_progress = now - last_progress
-        stall_timeout = timedelta(minutes=self.settings.stall_timeout_minutes)
+        stall_timeout = self._stall_timeout
 
         if time_since_progress > stall_timeout:
             logger.warning(
@@ -304,3 +364,59 @@ class StallDetector:
         job.last_progress_at = datetime.utcnow()
         session.add(job)
         logger.debug("progress_recorded", job_id=job.id)
+
+
+class GuardsPipeline:
+    """Runs stall, budget and retry-loop checks for a step and logs them as one event"""
+
+    def __init__(
+        self,
+        budget_guard: Optional[BudgetGuard] = None,
+        loop_detector: Optional[LoopDetector] = None,
+        stall_detector: Optional[StallDetector] = None,
+    ):
+        self.budget_guard = budget_guard or BudgetGuard()
+        self.loop_detector = loop_detector or LoopDetector()
+        self.stall_detector = stall_detector or StallDetector()
+
+    def evaluate(
+        self,
+        job: JobModel,
+        step: Optional[JobStepModel] = None,
+        estimated_step_cost: float = 0.0,
+    ) -> GuardResult:
+        """
+        Evaluate all guards for a step.
+
+        Args:
+            job: JobModel being executed
+            step: JobStepModel to check for retry loops (skipped if None)
+            estimated_step_cost: Estimated cost of upcoming step
+
+        Returns:
+            GuardResult combining stall, budget and loop results
+        """
+        stalled = self.stall_detector.check_job_stalled(job)
+        budget = self.budget_guard._evaluate(job, estimated_step_cost)
+        loop = None
+        consecutive = 0
+        if step is not None:
+            loop, consecutive = self.loop_detector._evaluate(job, step)
+
+        if logger.is_enabled_for(logging.INFO):
+            logger.info(
+                "guards_evaluated",
+                job_id=job.id,
+                step_id=step.id if step is not None else None,
+                stalled=stalled,
+                budget_status=budget.status.value,
+                budget_used_pct=f"{budget.budget_used_pct:.1%}",
+                remaining_usd=f"${budget.remaining_usd:.2f}",
+                should_block=budget.should_block,
+                loop_status=loop.status.value if loop else None,
+                retry_count=loop.retry_count if loop else None,
+                consecutive_failures=consecutive if loop else None,
+                should_replan=loop.should_replan if loop else None,
+            )
+
+        return GuardResult(stalled=stalled, budget=budget, loop=loop)
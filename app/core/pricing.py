@@ -31,6 +31,7 @@ class PricingTable:
         return Pricing(input=float(entry["input"]), output=float(entry["output"]))
 
 
+# Loaded on first use and kept for the life of the process; pricing.json edits need a restart
 _pricing_table: PricingTable | None = None
 
 
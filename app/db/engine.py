@@ -4,7 +4,9 @@ from contextlib import contextmanager
 from typing import Generator
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from app.core.config import get_settings
 
@@ -12,11 +14,24 @@ _engine = None
 _SessionLocal: sessionmaker | None = None
 
 
+def _pool_options(database_uri: str) -> dict:
+    # Only a QueuePool (file-backed SQLite) accepts pool_use_lifo; :memory: gets a SingletonThreadPool
+    url = make_url(database_uri)
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        # Reuse the most recently returned connection to keep SQLite's page cache warm
+        return {"pool_use_lifo": True}
+    return {}
+
+
 def get_engine():
     global _engine, _SessionLocal
     if _engine is None:
         settings = get_settings()
-        _engine = create_engine(settings.database_uri, connect_args={"check_same_thread": False})
+        _engine = create_engine(
+            settings.database_uri,
+            connect_args={"check_same_thread": False},
+            **_pool_options(settings.database_uri),
+        )
         _SessionLocal = sessionmaker(bind=_engine, autocommit=False, autoflush=False)
     return _engine
 
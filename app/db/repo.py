@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from .models import (
@@ -95,13 +96,22 @@ def increment_costs(
         tokens_out=tokens_out,
         cost_usd=cost_usd,
     )
+    add_job_usage(session, job, tokens_in=tokens_in, tokens_out=tokens_out, cost_usd=cost_usd)
+    session.add(cost)
+    return cost
+
+
+def add_job_usage(session: Session, job: JobModel, *, tokens_in: int, tokens_out: int, cost_usd: float) -> None:
     job.tokens_in += tokens_in
     job.tokens_out += tokens_out
     job.cost_usd += cost_usd
     job.requests_made += 1
-    session.add(cost)
     session.add(job)
-    return cost
+
+
+def insert_cost_entries(session: Session, rows: List[Dict[str, Any]]) -> None:
+    if rows:
+        session.execute(insert(CostEntryModel), rows)
 
 
 def create_step(session: Session, job: JobModel, name: str, step_type: str) -> JobStepModel:
@@ -111,6 +121,24 @@ def create_step(session: Session, job: JobModel, name: str, step_type: str) -> J
     return step
 
 
+def insert_planned_steps(session: Session, job: JobModel, names: Iterable[str]) -> None:
+    """Record the plan's steps as completed "plan" steps in one INSERT."""
+    now = datetime.utcnow()
+    rows = [
+        {
+            "job_id": job.id,
+            "name": name,
+            "step_type": "plan",
+            "status": "completed",
+            "details": "planned",
+            "finished_at": now,
+        }
+        for name in names
+    ]
+    if rows:
+        session.execute(insert(JobStepModel), rows)
+
+
 def update_step(session: Session, step: JobStepModel, *, status: str, details: Optional[str] = None) -> None:
     step.status = status
     step.details = details
@@ -145,6 +173,11 @@ def add_message_summary(
     return record
 
 
+def insert_message_summaries(session: Session, rows: List[Dict[str, Any]]) -> None:
+    if rows:
+        session.execute(insert(MessageSummaryModel), rows)
+
+
 def record_context_metric(
     session: Session,
     *,
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import repo
+from .models import JobModel
+
+
+class WriteBuffer:
+    """
+    Collects a job's cost-ledger and message-summary rows and writes them as bulk inserts.
+
+    Job totals (cost, tokens, requests) are still updated immediately by
+    enqueue_cost, because the budget guards read them before every step.
+    """
+
+    def __init__(self, max_rows: int = 50, max_age_seconds: float = 5.0):
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_seconds
+        self._costs: List[Dict[str, Any]] = []
+        self._summaries: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._costs) + len(self._summaries)
+
+    def enqueue_cost(
+        self,
+        session: Session,
+        job: JobModel,
+        *,
+        provider: str,
+        model: str,
+        tokens_in: int,
+        tokens_out: int,
+        cost_usd: float,
+    ) -> None:
+        repo.add_job_usage(session, job, tokens_in=tokens_in, tokens_out=tokens_out, cost_usd=cost_usd)
+        self._append(
+            self._costs,
+            {
+                "job_id": job.id,
+                "provider": provider,
+                "model": model,
+                "tokens_in": tokens_in,
+                "tokens_out": tokens_out,
+                "cost_usd": cost_usd,
+            },
+        )
+
+    def enqueue_summary(self, *, job_id: str, step_id: Optional[str], role: str, summary: str, tokens: int) -> None:
+        self._append(
+            self._summaries,
+            {"job_id": job_id, "step_id": step_id, "role": role, "summary": summary, "tokens": tokens},
+        )
+
+    def should_flush(self) -> bool:
+        if len(self) >= self.max_rows:
+            return True
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.max_age_seconds
+
+    def flush(self, session: Session) -> None:
+        """Insert all queued rows in the caller's transaction."""
+        repo.insert_cost_entries(session, self._costs)
+        repo.insert_message_summaries(session, self._summaries)
+        self._costs = []
+        self._summaries = []
+        self._oldest = None
+
+    def _append(self, rows: List[Dict[str, Any]], row: Dict[str, Any]) -> None:
+        # Stamp rows when they happen, not when they are flushed
+        row["created_at"] = datetime.utcnow()
+        rows.append(row)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from app.core.config import get_settings
+from app.core.logging import get_logger
+
+from .provider import BaseLLMProvider, LLMResponse
+
+logger = get_logger(__name__)
+
+# Prompts containing per-run identifiers never repeat, so caching them only costs writes
+_VOLATILE_RE = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"  # UUID
+    r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}",  # ISO timestamp
+    re.IGNORECASE,
+)
+
+_redis: Optional[Redis] = None
+
+# After a Redis error the cache is bypassed for this long instead of paying the
+# socket timeout on every call while Redis is down
+_REDIS_RETRY_AFTER_SECONDS = 30.0
+_redis_down_until = 0.0
+
+
+def _get_redis() -> Redis:
+    """Process-wide Redis client for the response cache."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(get_settings().redis_url, socket_connect_timeout=1, socket_timeout=1)
+    return _redis
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_down_until
+
+
+def _mark_redis_down(event: str, exc: RedisError) -> None:
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + _REDIS_RETRY_AFTER_SECONDS
+    logger.warning(event, error=str(exc), retry_after_seconds=_REDIS_RETRY_AFTER_SECONDS)
+
+
+def response_cache_key(namespace: str, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> str:
+    """
+    Build the exact-match cache key for an LLM call.
+
+    Args:
+        namespace: Tenant scope, e.g. "owner/repo"
+        model: Model name
+        messages: Chat messages sent to the model
+        **kwargs: Extra generation parameters (temperature, ...)
+
+    Returns:
+        Redis key for the call
+    """
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "params": kwargs},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    digest = hashlib.blake2b(canonical.encode("utf-8"), digest_size=20).hexdigest()
+    return f"llm-cache:{namespace}:{digest}"
+
+
+class CachedLLMProvider(BaseLLMProvider):
+    """Exact-match response cache in front of another provider; hits cost no tokens"""
+
+    def __init__(self, provider: BaseLLMProvider, *, namespace: str, ttl_seconds: int):
+        self.provider = provider
+        self.name = provider.name
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.supports_budget_cancel = provider.supports_budget_cancel
+
+    async def generate(self, *, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> LLMResponse:
+        if any(_VOLATILE_RE.search(msg.get("content") or "") for msg in messages):
+            return await self.provider.generate(model=model, messages=messages, **kwargs)
+
+        # The budget only limits a fresh call; it must not split otherwise identical requests
+        params = {name: value for name, value in kwargs.items() if name != "output_token_budget"}
+        key = response_cache_key(self.namespace, model, messages, **params)
+        if not _redis_available():
+            return await self.provider.generate(model=model, messages=messages, **kwargs)
+
+        # The client is synchronous; keep its socket waits off the shared event loop
+        try:
+            cached = await asyncio.to_thread(_get_redis().get, key)
+        except RedisError as exc:
+            _mark_redis_down("llm_cache_unavailable", exc)
+            return await self.provider.generate(model=model, messages=messages, **kwargs)
+
+        if cached is not None:
+            logger.info("llm_cache_hit", model=model, namespace=self.namespace)
+            return LLMResponse(text=cached.decode("utf-8"), tokens_in=0, tokens_out=0)
+
+        response = await self.provider.generate(model=model, messages=messages, **kwargs)
+        try:
+            await asyncio.to_thread(_get_redis().set, key, response.text.encode("utf-8"), ex=self.ttl_seconds)
+        except RedisError as exc:
+            _mark_redis_down("llm_cache_store_failed", exc)
+        return response
+
+    def count_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return self.provider.count_tokens(messages)
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List
+
+from app.core.logging import get_logger
+
+from .provider import BaseLLMProvider, LLMBudgetExceeded, LLMResponse
+
+logger = get_logger(__name__)
+
+
+def request_key(model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> str:
+    """
+    Identify an LLM call for coalescing.
+
+    Every generation parameter is part of the key, output_token_budget included,
+    so only calls that would get the same result share one provider call.
+    """
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "params": kwargs},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class CoalescingLLMProvider(BaseLLMProvider):
+    """Lets identical concurrent requests share one call of the wrapped provider"""
+
+    def __init__(self, provider: BaseLLMProvider):
+        self.provider = provider
+        self.name = provider.name
+        self.supports_budget_cancel = provider.supports_budget_cancel
+        # Request key -> call currently in flight. All LLM calls of a worker process run
+        # on its single loop thread, so the dict needs no lock.
+        self._inflight: Dict[str, asyncio.Future[LLMResponse]] = {}
+
+    async def generate(self, *, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> LLMResponse:
+        key = request_key(model, messages, **kwargs)
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self.provider.generate(model=model, messages=messages, **kwargs))
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return await asyncio.shield(inflight)
+
+        # The first caller pays for the call; followers are accounted like cache hits
+        logger.info("llm_call_coalesced", model=model)
+        try:
+            response = await asyncio.shield(inflight)
+        except LLMBudgetExceeded as exc:
+            raise LLMBudgetExceeded(exc.model, exc.output_token_budget) from exc
+        return LLMResponse(text=response.text, tokens_in=0, tokens_out=0)
+
+    def count_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return self.provider.count_tokens(messages)
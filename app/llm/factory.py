@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+from app.core.config import get_settings
+
+from .coalesce import CoalescingLLMProvider
+from .litellm_provider import LiteLLMProvider
+from .openai_provider import OpenAILLMProvider
+from .provider import BaseLLMProvider, DryRunLLMProvider
+
+
+def get_provider(dry_run: bool) -> BaseLLMProvider:
+    """Shared LLM provider for this process; models are chosen per call, so one instance serves every agent."""
+    settings = get_settings()
+    return _build_provider(dry_run, settings.llm_routing_enabled, settings.llm_request_coalescing_enabled)
+
+
+@lru_cache(maxsize=8)
+def _build_provider(dry_run: bool, routing_enabled: bool, coalescing_enabled: bool) -> BaseLLMProvider:
+    if dry_run:
+        return DryRunLLMProvider()
+    provider: BaseLLMProvider
+    if routing_enabled:
+        provider = LiteLLMProvider()
+    else:
+        # Fallback to legacy OpenAI provider when routing disabled
+        provider = OpenAILLMProvider()
+    if coalescing_enabled:
+        # Wrapped once here so concurrent steps and jobs of this process share in-flight calls
+        provider = CoalescingLLMProvider(provider)
+    return provider
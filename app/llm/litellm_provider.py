@@ -1,36 +1,93 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
+import httpx
 import litellm
 
 from app.core.config import get_settings
 from app.core.logging import get_logger
 
-from .provider import BaseLLMProvider, LLMResponse, estimate_tokens
+from .provider import PROMPT_CACHE_BREAKPOINT, BaseLLMProvider, LLMBudgetExceeded, LLMResponse, estimate_tokens
 
 logger = get_logger(__name__)
 
+# Shared connection pool for all LiteLLM calls in this process
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=256)
+_HTTP_TIMEOUT = httpx.Timeout(60.0)
+
+
+@lru_cache(maxsize=1)
+def _configure_litellm() -> None:
+    """Apply process-wide LiteLLM configuration once, on first provider use."""
+    settings = get_settings()
+    # Configure API keys for LiteLLM
+    if settings.openai_api_key:
+        os.environ["OPENAI_API_KEY"] = settings.openai_api_key
+    if settings.anthropic_api_key:
+        os.environ["ANTHROPIC_API_KEY"] = settings.anthropic_api_key
+
+    # Suppress LiteLLM verbose logging
+    litellm.suppress_debug_info = True
+
+    # Reuse keep-alive connections across calls instead of a client per SDK instance
+    if litellm.aclient_session is None:
+        litellm.aclient_session = httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+
+
+def _reset_after_fork() -> None:
+    """Drop the parent's shared client in a forked child; its sockets and loop state are not shareable."""
+    _configure_litellm.cache_clear()
+    litellm.aclient_session = None
+
+
+# Celery's prefork pool forks after import; each child builds its own client on first use
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _with_cache_control(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Mark the static prefix of the first agent system prompt as an Anthropic cache breakpoint.
+
+    OpenAI caches byte-identical prefixes automatically; Anthropic needs the
+    prefix sent as its own content block carrying cache_control.
+    """
+    for index, message in enumerate(messages):
+        content = message.get("content")
+        if message.get("role") != "system" or not isinstance(content, str):
+            continue
+        prefix, separator, suffix = content.partition(PROMPT_CACHE_BREAKPOINT)
+        if not separator:
+            continue
+        cached = {
+            **message,
+            "content": [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": separator + suffix},
+            ],
+        }
+        return [*messages[:index], cached, *messages[index + 1 :]]
+    return messages
+
 
 class LiteLLMProvider(BaseLLMProvider):
     """Unified provider for OpenAI, Anthropic, and other LLMs via LiteLLM"""
 
     name = "litellm"
+    supports_budget_cancel = True
 
     def __init__(self):
-        settings = get_settings()
-        # Configure API keys for LiteLLM
-        if settings.openai_api_key:
-            os.environ["OPENAI_API_KEY"] = settings.openai_api_key
-        if settings.anthropic_api_key:
-            os.environ["ANTHROPIC_API_KEY"] = settings.anthropic_api_key
-
-        # Suppress LiteLLM verbose logging
-        litellm.suppress_debug_info = True
+        _configure_litellm()
 
     async def generate(
-        self, *, model: str, messages: List[Dict[str, str]], **kwargs: Any
+        self,
+        *,
+        model: str,
+        messages: List[Dict[str, str]],
+        output_token_budget: Optional[int] = None,
+        **kwargs: Any
     ) -> LLMResponse:
         """
         Generate completion using LiteLLM's unified interface.
@@ -38,9 +95,18 @@ class LiteLLMProvider(BaseLLMProvider):
         Automatically handles API key selection based on model prefix:
         - gpt-* → OpenAI
         - claude-* → Anthropic
+
+        With output_token_budget set, the completion is streamed and aborted
+        with LLMBudgetExceeded as soon as its output outgrows the budget.
         """
         logger.info("litellm_call_start", model=model)
 
+        if model.startswith(("claude", "anthropic/")):
+            messages = _with_cache_control(messages)
+
+        if output_token_budget is not None:
+            return await self._generate_streaming(model, messages, output_token_budget, **kwargs)
+
         try:
             response = await litellm.acompletion(
                 model=model,
@@ -65,7 +131,53 @@ class LiteLLMProvider(BaseLLMProvider):
             logger.error("litellm_call_failed", model=model, error=str(exc))
             raise
 
-    def count_tokens(self, messages: List[Dict[str, str]]) -> int:
-        """Estimate token count for messages"""
-        combined = "\n".join(msg.get("content", "") for msg in messages)
-        return estimate_tokens(combined)
+    async def _generate_streaming(
+        self, model: str, messages: List[Dict[str, Any]], output_token_budget: int, **kwargs: Any
+    ) -> LLMResponse:
+        parts: List[str] = []
+        chars_out = 0
+        usage = None
+        try:
+            stream = await litellm.acompletion(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            try:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    chars_out += len(delta)
+                    # Same 4-chars-per-token estimate as estimate_tokens, kept incrementally
+                    if chars_out // 4 > output_token_budget:
+                        logger.warning(
+                            "litellm_stream_budget_cancelled", model=model, output_token_budget=output_token_budget
+                        )
+                        raise LLMBudgetExceeded(
+                            model,
+                            output_token_budget,
+                            tokens_in=usage.prompt_tokens if usage else estimate_tokens(str(messages)),
+                            tokens_out=chars_out // 4,
+                        )
+            finally:
+                # Closing the stream drops the connection, so the provider stops generating; the
+                # locked litellm's CustomStreamWrapper has no aclose(), where dropping it has to do
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        except Exception as exc:
+            logger.error("litellm_call_failed", model=model, error=str(exc))
+            raise
+
+        text = "".join(parts)
+        tokens_in = usage.prompt_tokens if usage else estimate_tokens(str(messages))
+        tokens_out = usage.completion_tokens if usage else estimate_tokens(text)
+        logger.info("litellm_call_complete", model=model, tokens_in=tokens_in, tokens_out=tokens_out)
+        return LLMResponse(text=text, tokens_in=tokens_in, tokens_out=tokens_out)
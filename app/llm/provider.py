@@ -5,6 +5,11 @@ from dataclasses import dataclass
 from typing import Any, Dict, List, Tuple
 
 
+# Separates the static agent instructions of a system prompt from its per-call
+# context; everything before it is byte-identical across calls and cacheable.
+PROMPT_CACHE_BREAKPOINT = "\n\nContext:\n"
+
+
 class LLMResponse:
     def __init__(self, text: str, tokens_in: int = 0, tokens_out: int = 0):
         self.text = text
@@ -12,6 +17,18 @@ class LLMResponse:
         self.tokens_out = tokens_out
 
 
+class LLMBudgetExceeded(RuntimeError):
+    """Raised when a streamed generation is aborted because its output outgrew the token budget."""
+
+    def __init__(self, model: str, output_token_budget: int, *, tokens_in: int = 0, tokens_out: int = 0):
+        super().__init__(f"{model} output exceeded the remaining budget of {output_token_budget} tokens")
+        self.model = model
+        self.output_token_budget = output_token_budget
+        # Estimated usage of the cancelled call; the prompt and partial output are still billed
+        self.tokens_in = tokens_in
+        self.tokens_out = tokens_out
+
+
 @dataclass
 class ModelCapability:
     """Model capability metadata for routing decisions"""
@@ -24,14 +41,17 @@ class ModelCapability:
 
 class BaseLLMProvider(ABC):
     name: str
+    # Whether generate() honours output_token_budget by streaming and aborting the call
+    supports_budget_cancel: bool = False
 
     @abstractmethod
     async def generate(self, *, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> LLMResponse:
         ...
 
     def count_tokens(self, messages: List[Dict[str, str]]) -> int:
-        combined = "\n".join(msg.get("content", "") for msg in messages)
-        return estimate_tokens(combined)
+        # Same estimate as joining the contents with newlines, without building the string
+        total_chars = sum(len(msg.get("content") or "") for msg in messages) + max(0, len(messages) - 1)
+        return max(1, total_chars // 4)
 
 
 def estimate_tokens(text: str) -> int:
@@ -2,17 +2,25 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
-from typing import Any, Dict
+from functools import cached_property, lru_cache
+from typing import Any, Dict, Iterable
 
-from app.core.config import get_settings
+from app.core.config import AppSettings, get_settings
 from app.core.logging import get_logger
-from app.core.pricing import get_pricing_table
+from app.core.pricing import PricingTable, get_pricing_table
 from app.llm.provider import estimate_tokens
 
 logger = get_logger(__name__)
 
 
-@dataclass
+def _compile_keyword_pattern(keywords: Iterable[str]) -> re.Pattern[str]:
+    """Compile all complexity keywords into one case-insensitive, word-bounded alternation."""
+    # Longest first so multi-word keywords win over any shorter overlapping one
+    alternation = "|".join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+
+@dataclass(slots=True, frozen=True)
 class RoutingDecision:
     """Decision made by the router for model selection"""
 
@@ -45,8 +53,16 @@ class LLMRouter:
     }
 
     def __init__(self):
-        self.settings = get_settings()
-        self.pricing = get_pricing_table()
+        # model -> (input, output) USD per token, resolved once per model
+        self._rate_cache: Dict[str, tuple[float, float]] = {}
+
+    @cached_property
+    def settings(self) -> AppSettings:
+        return get_settings()
+
+    @cached_property
+    def pricing(self) -> PricingTable:
+        return get_pricing_table()
 
     def select_model(
         self,
@@ -71,13 +87,18 @@ class LLMRouter:
         Returns:
             RoutingDecision with selected model and reasoning
         """
-        if not self.settings.llm_routing_enabled:
+        settings = self.settings
+        if not settings.llm_routing_enabled:
             # Fallback to legacy behavior
-            model = model_coder or self.settings.model_coder
+            model = model_coder or settings.model_coder
             return RoutingDecision(
                 model=model, reason="routing_disabled", complexity_score=5, estimated_cost=0.0
             )
 
+        model_simple = settings.model_simple
+        model_medium = settings.model_medium
+        model_complex = settings.model_complex
+
         # 1. Determine complexity (from step or auto-detect)
         complexity = self._get_complexity(step)
 
@@ -87,9 +108,9 @@ class LLMRouter:
 
         # 3. Check if large token count requires upgrade
         total_tokens = estimated_tokens_in + estimated_tokens_out
-        if total_tokens > self.settings.routing_token_threshold_large:
-            if candidate_model == self.settings.model_simple:
-                candidate_model = self.settings.model_medium
+        if total_tokens > settings.routing_token_threshold_large:
+            if candidate_model == model_simple:
+                candidate_model = model_medium
                 reason = f"token_upgrade_{total_tokens}_tokens"
 
         # 4. Budget constraint: downgrade if necessary
@@ -99,20 +120,21 @@ class LLMRouter:
         budget_per_step = remaining_budget * 0.5
 
         if estimated_cost > budget_per_step and budget_per_step > 0:
-            # Downgrade to cheaper model
-            if candidate_model == self.settings.model_complex:
-                candidate_model = self.settings.model_medium
-                reason = "budget_downgrade_from_complex"
-                estimated_cost = self._estimate_cost(
-                    candidate_model, estimated_tokens_in, estimated_tokens_out
-                )
-
-            if estimated_cost > budget_per_step and candidate_model == self.settings.model_medium:
-                candidate_model = self.settings.model_simple
-                reason = "budget_downgrade_from_medium"
+            # Walk down the tiers until the step fits; only visited tiers are priced
+            downgrades = (
+                (model_complex, model_medium, "budget_downgrade_from_complex"),
+                (model_medium, model_simple, "budget_downgrade_from_medium"),
+            )
+            for from_model, to_model, downgrade_reason in downgrades:
+                if candidate_model != from_model:
+                    continue
+                candidate_model = to_model
+                reason = downgrade_reason
                 estimated_cost = self._estimate_cost(
                     candidate_model, estimated_tokens_in, estimated_tokens_out
                 )
+                if estimated_cost <= budget_per_step:
+                    break
 
         logger.info(
             "llm_routing_decision",
@@ -143,24 +165,11 @@ class LLMRouter:
         if "complexity" in step and isinstance(step["complexity"], int):
             return max(1, min(10, step["complexity"]))  # Clamp to 1-10
 
-        # Auto-detect from keywords
-        text = " ".join(
-            [
-                step.get("title", ""),
-                step.get("rationale", ""),
-                step.get("acceptance", ""),
-            ]
-        ).lower()
-
-        detected_complexity = 5  # Default medium complexity
-        max_score = 0
-
-        for complexity_level, keywords in self.COMPLEXITY_KEYWORDS.items():
-            for keyword in keywords:
-                if re.search(r"\b" + re.escape(keyword) + r"\b", text):
-                    if complexity_level > max_score:
-                        max_score = complexity_level
-                        detected_complexity = complexity_level
+        # Auto-detect from keywords (memoized on the step text, so retries and
+        # replans of the same step skip the lowercase/join and regex scan)
+        detected_complexity = self._keyword_complexity(
+            step.get("title", ""), step.get("rationale", ""), step.get("acceptance", "")
+        )
 
         logger.debug(
             "complexity_auto_detected", step_title=step.get("title"), detected=detected_complexity
@@ -168,6 +177,26 @@ class LLMRouter:
 
         return detected_complexity
 
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _keyword_complexity(title: str, rationale: str, acceptance: str) -> int:
+        """
+        Detect complexity from keywords in the step text.
+
+        Returns:
+            Highest matching complexity level, or 5 if no keyword matches
+        """
+        text = " ".join([title, rationale, acceptance])
+
+        complexity = 0
+        # Matching is case-insensitive, so only matched keywords get case-folded
+        for match in _KW_RE.finditer(text):
+            complexity = max(complexity, _KW_LEVEL[match.group().casefold()])
+            if complexity == _KW_MAX_LEVEL:
+                break  # Nothing scores higher, skip the rest of the text
+
+        return complexity or 5  # Default medium complexity
+
     def _select_by_complexity(self, complexity: int) -> tuple[str, str]:
         """
         Select model tier based on complexity score.
@@ -176,11 +205,11 @@ class LLMRouter:
             Tuple of (model_name, reason)
         """
         if complexity <= self.settings.routing_complexity_threshold_medium:
-            return self.settings.model_simple, f"simple_task_complexity_{complexity}"
+            return self.settings.model_simple, _TIER_REASONS["simple", complexity]
         elif complexity <= self.settings.routing_complexity_threshold_complex:
-            return self.settings.model_medium, f"medium_task_complexity_{complexity}"
+            return self.settings.model_medium, _TIER_REASONS["medium", complexity]
         else:
-            return self.settings.model_complex, f"complex_task_complexity_{complexity}"
+            return self.settings.model_complex, _TIER_REASONS["complex", complexity]
 
     def _estimate_cost(self, model: str, tokens_in: int, tokens_out: int) -> float:
         """
@@ -189,11 +218,53 @@ class LLMRouter:
         Returns:
             Estimated cost in USD
         """
-        try:
-            pricing = self.pricing.get(model)
-            return (tokens_in / 1000) * pricing.input + (tokens_out / 1000) * pricing.output
-        except KeyError:
-            logger.warning("pricing_not_found", model=model)
-            # Fallback to default pricing
-            pricing = self.pricing.get("default")
-            return (tokens_in / 1000) * pricing.input + (tokens_out / 1000) * pricing.output
+        rate_in, rate_out = self._rates(model)
+        return tokens_in * rate_in + tokens_out * rate_out
+
+    def _rates(self, model: str) -> tuple[float, float]:
+        """
+        Per-token (input, output) pricing for a model, cached per router.
+
+        Returns:
+            Tuple of (input_usd_per_token, output_usd_per_token)
+        """
+        rates = self._rate_cache.get(model)
+        if rates is None:
+            try:
+                pricing = self.pricing.get(model)
+            except KeyError:
+                logger.warning("pricing_not_found", model=model)
+                # Fallback to default pricing
+                pricing = self.pricing.get("default")
+            rates = (pricing.input / 1000, pricing.output / 1000)
+            self._rate_cache[model] = rates
+        return rates
+
+
+# Keyword -> complexity level and one pattern over all keywords, built once at import
+_KW_LEVEL = {keyword: level for level, keywords in LLMRouter.COMPLEXITY_KEYWORDS.items() for keyword in keywords}
+_KW_RE = _compile_keyword_pattern(_KW_LEVEL)
+_KW_MAX_LEVEL = max(LLMRouter.COMPLEXITY_KEYWORDS)
+
+# Canonical tier reasons so repeated decisions share one string per (tier, complexity)
+_TIER_REASONS = {
+    (tier, complexity): f"{tier}_task_complexity_{complexity}"
+    for tier in ("simple", "medium", "complex")
+    for complexity in range(1, 11)
+}
+
+
+_router: LLMRouter | None = None
+
+
+def get_router() -> LLMRouter:
+    """
+    Shared router; rebuilt when the settings object or the pricing table is replaced.
+
+    The router caches per-model rates, so it follows get_pricing_table(). That table is
+    read from pricing.json once per process: after editing the file, restart the workers.
+    """
+    global _router
+    if _router is None or _router.settings is not get_settings() or _router.pricing is not get_pricing_table():
+        _router = LLMRouter()
+    return _router
@@ -10,16 +10,21 @@ celery_app = Celery(
     "auto_dev_orchestrator",
     broker=settings.redis_url,
     backend=settings.redis_url,
+    # Register task modules during worker bootstrap
+    include=["app.workers.job_worker"],
 )
 
-# Configure Celery to auto-discover tasks in app.workers module
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    # msgpack is smaller and faster than JSON; JSON stays accepted for in-flight messages
+    task_serializer="msgpack",
+    accept_content=["msgpack", "json"],
+    result_serializer="msgpack",
     timezone="UTC",
     enable_utc=True,
+    # Connection pooling for many concurrent workers on one Redis
+    broker_pool_limit=64,
+    redis_max_connections=128,
+    broker_transport_options={"socket_keepalive": True, "health_check_interval": 30},
+    # Jobs are long-running LLM pipelines; don't let one worker hoard queued jobs
+    worker_prefetch_multiplier=1,
 )
-
-# Explicitly import tasks to ensure they're registered
-from app.workers import job_worker  # noqa: E402, F401
@@ -1,62 +1,108 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from datetime import datetime, timedelta
+import os
+from datetime import datetime
 from pathlib import Path
 import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
+import orjson
+from celery.signals import worker_process_init
+
 from app.agents.coder import CoderAgent
 from app.agents.cto import CTOAgent
 from app.agents.prompts import build_prompt, parse_agents_file
 from app.context.engine import ContextEngine
 from app.core.config import get_settings
 from app.core.diffs import apply_unified_diff, safe_write
-from app.core.guards import BudgetGuard, LoopDetector, StallDetector, BudgetStatus, LoopStatus
+from app.core.guards import GuardsPipeline, BudgetStatus, LoopStatus
 from app.core.logging import get_logger
 from app.core.pricing import get_pricing_table
 from app.db import repo
 from app.db.engine import session_scope
 from app.db.models import JobStatus
+from app.db.write_buffer import WriteBuffer
 from app.git import repo_ops
-from app.llm.litellm_provider import LiteLLMProvider
-from app.llm.openai_provider import OpenAILLMProvider
-from app.llm.provider import BaseLLMProvider, DryRunLLMProvider
-from app.llm.router import LLMRouter
+from app.llm.cache import CachedLLMProvider
+from app.llm.factory import get_provider
+from app.llm.provider import LLMBudgetExceeded
+from app.llm.router import get_router
 from app.workers.replanning import trigger_replanning
 
 from .celery_app import celery_app
 
 logger = get_logger(__name__)
 
+# (messages, diagnostics) produced by _prepare_messages
+_ContextBuild = tuple[List[Dict[str, str]], Optional[Dict[str, Any]]]
 
-def _select_provider(dry_run: bool) -> BaseLLMProvider:
-    """Select LLM provider based on dry_run flag and routing settings"""
-    if dry_run:
-        return DryRunLLMProvider()
-    settings = get_settings()
-    if settings.llm_routing_enabled:
-        return LiteLLMProvider()
-    # Fallback to legacy OpenAI provider when routing disabled
-    return OpenAILLMProvider()
+_CONTEXT_DISABLED_REPORT = "## Context Report\n- Context engine disabled"
+
+
+def _calculate_cost(
+    model: str, tokens_in: int, tokens_out: int, rates: Optional[Dict[str, tuple[float, float]]] = None
+) -> float:
+    # rates caches (input, output) USD per token by model for the caller, e.g. one job
+    rate = rates.get(model) if rates is not None else None
+    if rate is None:
+        try:
+            pricing = get_pricing_table().get(model)
+        except KeyError:
+            logger.warning("pricing_not_found", model=model)
+            # Fallback to default pricing
+            pricing = get_pricing_table().get("default")
+        rate = (pricing.input / 1000, pricing.output / 1000)
+        if rates is not None:
+            rates[model] = rate
+    return tokens_in * rate[0] + tokens_out * rate[1]
+
+
+def _output_token_budget(
+    model: str, remaining_usd: float, tokens_in: int, rates: Optional[Dict[str, tuple[float, float]]] = None
+) -> Optional[int]:
+    """Output tokens model can still afford after paying for tokens_in, or None if output is free."""
+    per_token_out = _calculate_cost(model, 0, 1, rates)
+    if per_token_out <= 0:
+        return None
+    affordable = (remaining_usd - _calculate_cost(model, tokens_in, 0, rates)) / per_token_out
+    return max(0, int(affordable))
+
+
+def _book_cancelled_call(
+    job_id: str, provider_name: str, error: LLMBudgetExceeded, rates: Optional[Dict[str, tuple[float, float]]]
+) -> None:
+    # A stream cancelled for budget still paid for its prompt and the output it produced
+    with session_scope() as session:
+        job = repo.get_job(session, job_id)
+        repo.increment_costs(
+            session,
+            job,
+            provider=provider_name,
+            model=error.model,
+            tokens_in=error.tokens_in,
+            tokens_out=error.tokens_out,
+            cost_usd=_calculate_cost(error.model, error.tokens_in, error.tokens_out, rates),
+        )
 
 
-def _calculate_cost(model: str, tokens_in: int, tokens_out: int) -> float:
-    pricing = get_pricing_table().get(model)
-    return (tokens_in / 1000) * pricing.input + (tokens_out / 1000) * pricing.output
+def _job_deadline(job) -> Optional[float]:
+    # Wall-clock limit as a time.monotonic() deadline, computed once per run
+    if not job.started_at:
+        return None
+    elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+    return time.monotonic() + job.max_minutes * 60 - elapsed
 
 
-def _check_limits(job, *, now: datetime) -> None:
-    settings = get_settings()
+def _check_limits(job, *, deadline: Optional[float]) -> None:
     if job.cost_usd >= job.budget_usd:
         raise RuntimeError("Budget limit exceeded")
     if job.requests_made >= job.max_requests:
         raise RuntimeError("Request limit exceeded")
-    if job.started_at:
-        elapsed = now - job.started_at
-        if elapsed > timedelta(minutes=job.max_minutes):
-            raise RuntimeError("Wall-clock limit exceeded")
+    if deadline is not None and time.monotonic() >= deadline:
+        raise RuntimeError("Wall-clock limit exceeded")
 
 
 def _apply_diff(repo_path: Path, diff_text: str) -> None:
@@ -64,32 +110,121 @@ def _apply_diff(repo_path: Path, diff_text: str) -> None:
         safe_write(file_path, content)
 
 
+class _LoopThread:
+    """Event loop running forever in a daemon thread; sync code submits coroutines to it."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        # Bounded pool for blocking calls handed off via asyncio.to_thread (git, network)
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=4, thread_name_prefix="job-worker-io"))
+        self.thread = threading.Thread(target=self.loop.run_forever, name="job-worker-loop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+
+_loop_thread: Optional[_LoopThread] = None
+_loop_thread_lock = threading.Lock()
+
+
+def _get_loop_thread() -> _LoopThread:
+    # Started lazily and per process: threads do not survive Celery's prefork
+    global _loop_thread
+    if _loop_thread is None or _loop_thread.pid != os.getpid():
+        with _loop_thread_lock:
+            if _loop_thread is None or _loop_thread.pid != os.getpid():
+                _loop_thread = _LoopThread()
+    return _loop_thread
+
+
 def _run_coro(coro):
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
-    if loop and loop.is_running():
-        result_holder: dict[str, object] = {}
-        error_holder: dict[str, BaseException] = {}
-
-        def runner() -> None:
-            try:
-                result_holder["value"] = asyncio.run(coro)
-            except BaseException as exc:  # pragma: no cover
-                error_holder["error"] = exc
+    # One long-lived loop keeps the shared LiteLLM HTTP client's keep-alive
+    # connections valid across calls instead of a fresh loop per call
+    return _get_loop_thread().run(coro)
 
-        thread = threading.Thread(target=runner, daemon=True)
-        thread.start()
-        thread.join()
-        if "error" in error_holder:
-            raise error_holder["error"]
-        return result_holder.get("value")
-    return asyncio.run(coro)
+
+@worker_process_init.connect
+def _warm_worker_process(**_kwargs) -> None:
+    # Pool children start their loop thread and LLM client before the first task, not during it
+    _get_loop_thread()
+    get_provider(get_settings().dry_run)
+
+
+def _run_in_background(func, *args) -> Future:
+    # Blocking call on the loop's bounded executor; the caller collects the result later
+    return _get_loop_thread().submit(asyncio.to_thread(func, *args))
+
+
+async def _gather_outcomes(coros: List[Any]) -> List[Any]:
+    # Failed calls come back as their exception so each step handles its own failure
+    outcomes = await asyncio.gather(*coros, return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+            raise outcome
+    return outcomes
+
+
+def _abandon_steps(step_ids: List[str], details: str) -> None:
+    # Steps created for a batch that ends before its LLM calls are failed, not left "running"
+    if not step_ids:
+        return
+    with session_scope() as session:
+        for step_id in step_ids:
+            step_model = repo.get_step(session, step_id)
+            if step_model:
+                repo.update_step(session, step_model, status="failed", details=details)
+
+
+def _plan_batches(plan: List[Dict[str, Any]], max_size: int) -> List[List[Dict[str, Any]]]:
+    """
+    Group consecutive plan steps that can be implemented concurrently.
+
+    Only steps that declare their ``files`` run concurrently: a step joins the
+    current batch if its files are disjoint from the batch's and it lists no
+    batch member (by plan index) in ``depends_on``. A step without files may
+    edit anything, so it runs alone.
+
+    Args:
+        plan: Steps from the CTO plan, in order
+        max_size: Maximum steps per batch (concurrent LLM calls)
+
+    Returns:
+        Batches of steps covering the plan in order
+    """
+    batches: List[List[Dict[str, Any]]] = []
+    batch: List[Dict[str, Any]] = []
+    batch_indices: set[int] = set()
+    batch_files: set[str] = set()
+    batch_open = False  # Closed as soon as a member without files is added
+    for index, step in enumerate(plan):
+        files = set(step.get("files") or ())
+        known_scope = bool(files)
+        joins = (
+            batch_open
+            and known_scope
+            and len(batch) < max_size
+            and batch_indices.isdisjoint(step.get("depends_on") or ())
+            and batch_files.isdisjoint(files)
+        )
+        if batch and not joins:
+            batches.append(batch)
+            batch, batch_indices, batch_files = [], set(), set()
+        batch.append(step)
+        batch_indices.add(index)
+        batch_files |= files
+        batch_open = known_scope
+    if batch:
+        batches.append(batch)
+    return batches
 
 
 def _prepare_messages(
-    provider: BaseLLMProvider,
+    engine: ContextEngine,
     *,
     job_id: str,
     step_id: Optional[str],
@@ -98,11 +233,7 @@ def _prepare_messages(
     step: Optional[Dict[str, Any]],
     base_messages: List[Dict[str, str]],
     repo_path: Optional[Path],
-) -> tuple[List[Dict[str, str]], Optional[Dict[str, Any]]]:
-    settings = get_settings()
-    if not settings.context_engine_enabled:
-        return base_messages, None
-    engine = ContextEngine(provider)
+) -> _ContextBuild:
     with session_scope() as session:
         result = engine.build_context(
             session=session,
@@ -114,12 +245,27 @@ def _prepare_messages(
             base_messages=base_messages,
             repo_path=repo_path,
         )
-        return result.messages, result.diagnostics
+    return result.messages, result.diagnostics
+
+
+def _json_preview(value: Any, limit: int = 2000) -> str:
+    """Compact JSON of value cut to limit chars; long lists stop serializing once the limit is reached."""
+    if not isinstance(value, list):
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()[:limit]
+    parts: List[str] = []
+    size = 1
+    for item in value:
+        if size > limit:
+            break
+        encoded = orjson.dumps(item, option=orjson.OPT_NON_STR_KEYS).decode()
+        parts.append(encoded)
+        size += len(encoded) + 1
+    return ("[" + ",".join(parts) + "]")[:limit]
 
 
 def _format_context_report(diagnostics: Optional[Dict[str, Any]]) -> str:
     if not diagnostics:
-        return "## Context Report\n- Context engine disabled"
+        return _CONTEXT_DISABLED_REPORT
     budget = diagnostics.get("budget", {})
     lines = ["## Context Report"]
     lines.append(
@@ -148,9 +294,10 @@ def _format_context_report(diagnostics: Optional[Dict[str, Any]]) -> str:
 def execute_job(self, job_id: str):
     settings = get_settings()
     spec = parse_agents_file()
-    provider_cto = _select_provider(settings.dry_run)
-    provider_coder = _select_provider(settings.dry_run)
+    provider_cto = provider_coder = get_provider(settings.dry_run)
     last_context_diag: Optional[Dict[str, Any]] = None
+    write_buffer = WriteBuffer()
+    price_rates: Dict[str, tuple[float, float]] = {}
     try:
         with session_scope() as session:
             job = repo.get_job(session, job_id)
@@ -166,29 +313,50 @@ def execute_job(self, job_id: str):
             model_cto = job.model_cto or settings.model_cto
             model_coder = job.model_coder or settings.model_coder
             repo.update_job_status(session, job, JobStatus.RUNNING)
+            deadline = _job_deadline(job)
             session.commit()
+        if settings.llm_response_cache_enabled and not settings.dry_run:
+            # Scope cached responses to the target repository
+            cache_namespace = f"{job_repo_owner}/{job_repo_name}"
+            provider_cto = provider_coder = CachedLLMProvider(
+                provider_cto, namespace=cache_namespace, ttl_seconds=settings.llm_response_cache_ttl_seconds
+            )
         cto_agent = CTOAgent(provider_cto, spec, model_cto, settings.dry_run)
+        coder_agent = CoderAgent(provider_coder, spec, model_coder, settings.dry_run)
+        router = get_router()
+        # Coder calls stream and abort once they would overspend; needs a provider that can cancel
+        stream_budget_cancel = settings.stream_with_budget_cancel and provider_coder.supports_budget_cancel
+        # Built once per job; the engine only depends on the provider and settings
+        context_engine = ContextEngine(provider_coder) if settings.context_engine_enabled else None
         base_prompt = build_prompt(spec.section("CTO-AI"), f"Task: {job_task}")
         base_messages = [{"role": "system", "content": base_prompt}]
-        plan_messages, context_diag = _prepare_messages(
-            provider_cto,
-            job_id=job_id,
-            step_id=None,
-            role="cto-plan",
-            task=job_task,
-            step=None,
-            base_messages=base_messages,
-            repo_path=None,
+        plan_messages = base_messages
+        if context_engine is not None:
+            plan_messages, context_diag = _prepare_messages(
+                context_engine,
+                job_id=job_id,
+                step_id=None,
+                role="cto-plan",
+                task=job_task,
+                step=None,
+                base_messages=base_messages,
+                repo_path=None,
+            )
+            if context_diag:
+                last_context_diag = context_diag
+        # Clone/update the repository while the CTO plans; neither depends on the other
+        clone_future = (
+            None
+            if settings.dry_run
+            else _run_in_background(repo_ops.clone_or_update_repo, job_repo_owner, job_repo_name, job_branch_base)
         )
-        if context_diag:
-            last_context_diag = context_diag
         plan, plan_tokens_in, plan_tokens_out = _run_coro(
             cto_agent.create_plan(job_task, messages=plan_messages)
         )
         with session_scope() as session:
             job = repo.get_job(session, job_id)
             if plan_tokens_in or plan_tokens_out:
-                cost = _calculate_cost(model_cto, plan_tokens_in, plan_tokens_out)
+                cost = _calculate_cost(model_cto, plan_tokens_in, plan_tokens_out, price_rates)
                 repo.increment_costs(
                     session,
                     job,
@@ -203,7 +371,7 @@ def execute_job(self, job_id: str):
                 job_id=job_id,
                 step_id=None,
                 role="cto-plan",
-                summary=json.dumps(plan, ensure_ascii=False)[:2000],
+                summary=_json_preview(plan),
                 tokens=plan_tokens_out,
             )
             session.commit()
@@ -211,9 +379,7 @@ def execute_job(self, job_id: str):
             job = repo.get_job(session, job_id)
             job.last_action = "plan"
             session.add(job)
-            for step in plan:
-                step_model = repo.create_step(session, job, step.get("title", "Step"), "plan")
-                repo.update_step(session, step_model, status="completed", details="planned")
+            repo.insert_planned_steps(session, job, [step.get("title", "Step") for step in plan])
             session.commit()
         feature_branch = f"auto/{job_id[:8]}"
         if settings.dry_run:
@@ -221,14 +387,18 @@ def execute_job(self, job_id: str):
             repo_path.mkdir(parents=True, exist_ok=True)
             repo_instance = None
         else:
-            repo_path = repo_ops.clone_or_update_repo(job_repo_owner, job_repo_name, job_branch_base)
+            repo_path = clone_future.result()
             repo_instance = repo_ops.Repo(repo_path)
             repo_ops.create_branch(repo_instance, feature_branch, job_branch_base)
+            if isinstance(provider_coder, CachedLLMProvider):
+                # Coder responses depend on the checked-out code, so key them to its commit
+                provider_coder.namespace = f"{cache_namespace}@{repo_instance.head.commit.hexsha}"
 
         # Initialize guards
-        budget_guard = BudgetGuard()
-        loop_detector = LoopDetector()
-        stall_detector = StallDetector()
+        guards = GuardsPipeline()
+        budget_guard = guards.budget_guard
+        loop_detector = guards.loop_detector
+        stall_detector = guards.stall_detector
 
         # Record initial progress
         with session_scope() as session:
@@ -236,253 +406,360 @@ def execute_job(self, job_id: str):
             stall_detector.record_progress(job, session)
             session.commit()
 
-        for step in plan:
-            with session_scope() as session:
-                job = repo.get_job(session, job_id)
-
-                # 1. Check if job stalled
-                if stall_detector.check_job_stalled(job):
-                    logger.error("job_stalled", job_id=job_id)
-                    repo.update_job_status(session, job, JobStatus.STALLED)
-                    job.last_action = "Job stalled: no progress timeout"
-                    session.add(job)
-                    session.commit()
-                    return
-
-                # 2. Legacy limit check (will be replaced by budget guard)
-                _check_limits(job, now=datetime.utcnow())
-
-                # 3. Create step first to get step_id for routing
-                step_model = repo.create_step(session, job, step.get("title", "step"), "execution")
-                step_id = step_model.id
-                repo.update_step(session, step_model, status="running")
-                session.commit()
-
-            # 4. Budget guard check (after step creation, before expensive LLM call)
-            # Extract job attributes needed for routing (avoid detached instance errors)
-            with session_scope() as session:
-                job = repo.get_job(session, job_id)
+        # Step commits run in the background until the next diff (or the push) needs them
+        pending_commit: Optional[Future] = None
+
+        # Batches still to run; a replan swaps them for the batches of the new plan
+        pending_batches = _plan_batches(plan, settings.max_concurrent_llm)
+        while pending_batches:
+            batch = pending_batches.pop(0)
+            # Pre-LLM checks and routing run step by step; only the LLM calls overlap
+            prepared: List[Dict[str, Any]] = []
+            batch_step_ids: List[str] = []
+            halt_reason: Optional[str] = None
+            try:
+                for step in batch:
+                    # One session covers the guard checks and step bookkeeping before the LLM
+                    # call; it closes (and commits once) before any network I/O starts.
+                    with session_scope() as session:
+                        job = repo.get_job(session, job_id)
+
+                        # Evaluate stall + budget guards in one pass (single log event).
+                        # Estimated cost is conservative, counts steps already in flight in
+                        # this batch, and is refined by the router later.
+                        guard_result = guards.evaluate(job, estimated_step_cost=0.5 * (len(prepared) + 1))
+
+                        # 1. Check if job stalled
+                        if guard_result.stalled:
+                            logger.error("job_stalled", job_id=job_id)
+                            repo.update_job_status(session, job, JobStatus.STALLED)
+                            job.last_action = "Job stalled: no progress timeout"
+                            session.add(job)
+                            halt_reason = "job stalled"
+                            break
+
+                        # 2. Legacy limit check (will be replaced by budget guard)
+                        _check_limits(job, deadline=deadline)
+
+                        # 3. Create step first to get step_id for routing
+                        step_model = repo.create_step(session, job, step.get("title", "step"), "execution")
+                        step_id = step_model.id
+                        batch_step_ids.append(step_id)
+                        repo.update_step(session, step_model, status="running")
+
+                        # 4. Budget guard check (after step creation, before expensive LLM call)
+                        budget_check = guard_result.budget
+
+                        if budget_check.should_block:
+                            logger.error(
+                                "budget_exceeded",
+                                job_id=job_id,
+                                budget_used_pct=f"{budget_check.budget_used_pct:.1%}",
+                            )
+                            repo.update_job_status(session, job, JobStatus.BUDGET_EXCEEDED)
+                            job.last_action = f"Budget exceeded: {budget_check.budget_used_pct:.1%} used"
+                            session.add(job)
 
-                # Estimate cost for budget check
-                estimated_cost = 0.5  # Conservative estimate, will be refined by router
+                            # Mark step as failed
+                            repo.update_step(session, step_model, status="failed", details="Budget exceeded")
+                            halt_reason = "budget exceeded"
+                            break
 
-                budget_check = budget_guard.check_budget(job, estimated_cost)
+                        if budget_check.should_warn:
+                            budget_guard.record_warning(job, budget_check.budget_used_pct, session)
+                            logger.warning(
+                                "budget_warning",
+                                job_id=job_id,
+                                threshold=f"{budget_check.budget_used_pct:.1%}",
+                            )
 
-                if budget_check.should_block:
-                    logger.error(
-                        "budget_exceeded",
-                        job_id=job_id,
-                        budget_used_pct=f"{budget_check.budget_used_pct:.1%}",
+                        # Extract values for router before the session closes (avoid detached instance errors)
+                        job_budget_usd = job.budget_usd
+                        job_cost_usd = job.cost_usd or 0.0
+                        job_model_coder = job.model_coder
+
+                    # Prepare coder messages
+                    coder_context = orjson.dumps({"task": job_task, "step": step}, option=orjson.OPT_INDENT_2).decode()
+                    coder_prompt = build_prompt(spec.section("CODER-AI"), coder_context)
+                    base_messages = [{"role": "system", "content": coder_prompt}]
+                    messages = base_messages
+                    if context_engine is not None:
+                        messages, context_diag = _prepare_messages(
+                            context_engine,
+                            job_id=job_id,
+                            step_id=step_id,
+                            role="coder-step",
+                            task=job_task,
+                            step=step,
+                            base_messages=base_messages,
+                            repo_path=repo_path,
+                        )
+                        if context_diag:
+                            last_context_diag = context_diag
+
+                    # Route to optimal model if routing enabled (use extracted values, not detached job)
+                    estimated_tokens_in = provider_coder.count_tokens(messages)
+                    estimated_tokens_out = 2000  # Conservative estimate
+
+                    routing_decision = router.select_model(
+                        step=step,
+                        budget_usd=job_budget_usd,
+                        cost_usd=job_cost_usd,
+                        model_coder=job_model_coder,
+                        estimated_tokens_in=estimated_tokens_in,
+                        estimated_tokens_out=estimated_tokens_out,
                     )
-                    repo.update_job_status(session, job, JobStatus.BUDGET_EXCEEDED)
-                    job.last_action = f"Budget exceeded: {budget_check.budget_used_pct:.1%} used"
-                    session.add(job)
-
-                    # Mark step as failed
-                    step_model = repo.get_step(session, step_id)
-                    if step_model:
-                        repo.update_step(session, step_model, status="failed", details="Budget exceeded")
 
-                    session.commit()
-                    return
+                    model_name = routing_decision.model
+                    output_token_budget = None
+                    if stream_budget_cancel:
+                        # Steps of a batch run concurrently, so each gets an equal share of what is left
+                        output_token_budget = _output_token_budget(
+                            model_name,
+                            (job_budget_usd - job_cost_usd) / len(batch),
+                            estimated_tokens_in,
+                            price_rates,
+                        )
+                        if output_token_budget == 0:
+                            # The prompt alone would use up this step's share; don't pay for it
+                            logger.warning("coder_step_skipped_no_budget", step_id=step_id, model=model_name)
+                            _abandon_steps([step_id], "Not run: remaining budget cannot cover the prompt")
+                            continue
+
+                    logger.info(
+                        "coder_step_routing",
+                        step_id=step_id,
+                        model=model_name,
+                        reason=routing_decision.reason,
+                        complexity=routing_decision.complexity_score,
+                    )
 
-                if budget_check.should_warn:
-                    budget_guard.record_warning(job, budget_check.budget_used_pct, session)
-                    logger.warning(
-                        "budget_warning",
-                        job_id=job_id,
-                        threshold=f"{budget_check.budget_used_pct:.1%}",
+                    prepared.append(
+                        {
+                            "step": step,
+                            "step_id": step_id,
+                            "messages": messages,
+                            "model_name": model_name,
+                            "output_token_budget": output_token_budget,
+                        }
                     )
-                    session.commit()
+            except Exception:
+                # The job fails; steps created for this batch must not stay "running"
+                _abandon_steps(batch_step_ids, "Not run: batch preparation failed")
+                raise
+
+            if halt_reason is not None:
+                # A guard stopped the job; steps prepared before it are never sent to the LLM
+                _abandon_steps([item["step_id"] for item in prepared], f"Not run: {halt_reason}")
+                if pending_commit is not None:
+                    pending_commit.result()
+                return
 
-                # Extract values for router (before session closes)
-                job_budget_usd = job.budget_usd
-                job_cost_usd = job.cost_usd or 0.0
-                job_model_coder = job.model_coder
-
-            # Initialize coder agent and prepare messages
-            coder_agent = CoderAgent(provider_coder, spec, model_coder, settings.dry_run)
-            coder_context = json.dumps({"task": job_task, "step": step}, ensure_ascii=False, indent=2)
-            coder_prompt = build_prompt(spec.section("CODER-AI"), coder_context)
-            base_messages = [{"role": "system", "content": coder_prompt}]
-            messages, context_diag = _prepare_messages(
-                provider_coder,
-                job_id=job_id,
-                step_id=step_id,
-                role="coder-step",
-                task=job_task,
-                step=step,
-                base_messages=base_messages,
-                repo_path=repo_path,
+            # Implement all prepared steps with their routed models concurrently
+            outcomes = _run_coro(
+                _gather_outcomes(
+                    [
+                        coder_agent.implement_step(
+                            job_task,
+                            item["step"],
+                            messages=item["messages"],
+                            model=item["model_name"],
+                            output_token_budget=item["output_token_budget"],
+                        )
+                        for item in prepared
+                    ]
+                )
             )
-            if context_diag:
-                last_context_diag = context_diag
 
-            # Route to optimal model if routing enabled (use extracted values, not detached job)
-            router = LLMRouter()
-            estimated_tokens_in = provider_coder.count_tokens(messages)
-            estimated_tokens_out = 2000  # Conservative estimate
-
-            routing_decision = router.select_model(
-                step=step,
-                budget_usd=job_budget_usd,
-                cost_usd=job_cost_usd,
-                model_coder=job_model_coder,
-                estimated_tokens_in=estimated_tokens_in,
-                estimated_tokens_out=estimated_tokens_out,
-            )
+            # Results are applied in plan order, so diffs and commits stay serialized
+            for item, outcome in zip(prepared, outcomes):
+                step = item["step"]
+                step_id = item["step_id"]
+                messages = item["messages"]
+                model_name = item["model_name"]
 
-            model_name = routing_decision.model
+                if isinstance(outcome, LLMBudgetExceeded):
+                    # Cut off to stay within budget: book what it used and don't retry elsewhere
+                    _book_cancelled_call(job_id, provider_coder.name, outcome, price_rates)
+                    with session_scope() as session:
+                        step_model = repo.get_step(session, step_id)
+                        if step_model:
+                            step_model.failure_reason = str(outcome)
+                            repo.update_step(session, step_model, status="failed", details=str(outcome))
+                    continue
 
-            logger.info(
-                "coder_step_routing",
-                step_id=step_id,
-                model=model_name,
-                reason=routing_decision.reason,
-                complexity=routing_decision.complexity_score,
-            )
+                if isinstance(outcome, Exception):
+                    primary_error = outcome
+                    logger.warning(
+                        "coder_step_primary_model_failed",
+                        model=model_name,
+                        error=str(primary_error),
+                        fallback_model=settings.routing_fallback_model,
+                    )
 
-            # Implement step with routed model, with fallback on error
-            try:
-                result = _run_coro(coder_agent.implement_step(job_task, step, messages=messages, model=model_name))
-            except Exception as primary_error:
-                logger.warning(
-                    "coder_step_primary_model_failed",
-                    model=model_name,
-                    error=str(primary_error),
-                    fallback_model=settings.routing_fallback_model,
-                )
+                    # Handle step failure with loop detection
+                    with session_scope() as session:
+                        job = repo.get_job(session, job_id)
+                        remaining_usd = job.budget_usd - (job.cost_usd or 0.0)
+                        step_model = repo.get_step(session, step_id)
 
-                # Handle step failure with loop detection
-                with session_scope() as session:
-                    job = repo.get_job(session, job_id)
-                    step_model = repo.get_step(session, step_id)
+                        if step_model:
+                            # Increment retry count
+                            step_model.retry_count = (step_model.retry_count or 0) + 1
+                            step_model.failure_reason = str(primary_error)
+                            repo.update_step(session, step_model, status="failed", details=str(primary_error))
+
+                            # Update job failure tracking
+                            job.last_failed_step_id = step_id
+                            if job.last_failed_step_id == step_id:
+                                job.consecutive_failures = (job.consecutive_failures or 0) + 1
+                            else:
+                                job.consecutive_failures = 1
+                            session.add(job)
+
+                            # Check for loop
+                            loop_check = loop_detector.check_step_retry(job, step_model)
+
+                            if loop_check.should_replan:
+                                logger.warning(
+                                    "loop_detected_triggering_replan", job_id=job_id, reason=loop_check.reason
+                                )
+                                session.commit()
+
+                                # Trigger replanning
+                                try:
+                                    new_plan = _run_coro(
+                                        trigger_replanning(
+                                            job_id=job_id, reason=loop_check.reason, failed_step_name=step.get("title")
+                                        )
+                                    )
 
-                    if step_model:
-                        # Increment retry count
-                        step_model.retry_count = (step_model.retry_count or 0) + 1
-                        step_model.failure_reason = str(primary_error)
-                        repo.update_step(session, step_model, status="failed", details=str(primary_error))
-
-                        # Update job failure tracking
-                        job.last_failed_step_id = step_id
-                        if job.last_failed_step_id == step_id:
-                            job.consecutive_failures = (job.consecutive_failures or 0) + 1
-                        else:
-                            job.consecutive_failures = 1
-                        session.add(job)
-
-                        # Check for loop
-                        loop_check = loop_detector.check_step_retry(job, step_model)
-
-                        if loop_check.should_replan:
-                            logger.warning(
-                                "loop_detected_triggering_replan", job_id=job_id, reason=loop_check.reason
+                                    # Replace the remaining batches; results of this batch still apply
+                                    pending_batches = _plan_batches(new_plan, settings.max_concurrent_llm)
+                                    logger.info("replan_applied", job_id=job_id, new_steps=len(new_plan))
+                                    continue
+
+                                except Exception as replan_error:
+                                    logger.error("replanning_failed", error=str(replan_error))
+                                    raise replan_error
+                            else:
+                                session.commit()
+
+                    # Try fallback model if no replanning triggered, capped like the primary call
+                    fallback_model = settings.routing_fallback_model
+                    fallback_budget = None
+                    if stream_budget_cancel:
+                        fallback_budget = _output_token_budget(
+                            fallback_model, remaining_usd, provider_coder.count_tokens(messages), price_rates
+                        )
+                        if fallback_budget == 0:
+                            logger.warning("coder_step_fallback_skipped_no_budget", fallback_model=fallback_model)
+                            continue
+                    try:
+                        result = _run_coro(
+                            coder_agent.implement_step(
+                                job_task,
+                                step,
+                                messages=messages,
+                                model=fallback_model,
+                                output_token_budget=fallback_budget,
                             )
-                            session.commit()
-
-                            # Trigger replanning
-                            try:
-                                new_plan = _run_coro(
-                                    trigger_replanning(
-                                        job_id=job_id, reason=loop_check.reason, failed_step_name=step.get("title")
-                                    )
+                        )
+                        model_name = fallback_model
+                        logger.info("coder_step_fallback_success", fallback_model=model_name)
+                    except Exception as fallback_error:
+                        logger.error("coder_step_fallback_failed", error=str(fallback_error))
+                        if isinstance(fallback_error, LLMBudgetExceeded):
+                            _book_cancelled_call(job_id, provider_coder.name, fallback_error, price_rates)
+
+                        # Increment retry count again for fallback failure
+                        with session_scope() as session:
+                            step_model = repo.get_step(session, step_id)
+                            if step_model:
+                                step_model.retry_count = (step_model.retry_count or 0) + 1
+                                session.add(step_model)
+                                session.commit()
+
+                        # Continue to next step instead of raising
+                        continue
+                else:
+                    result = outcome
+                diff_text = result.get("diff", "")
+                summary = result.get("summary", "")
+                if diff_text:
+                    if pending_commit is not None:
+                        # commit_all stages everything, so it must finish before new files land
+                        pending_commit.result()
+                        pending_commit = None
+                    try:
+                        _apply_diff(Path(repo_path), diff_text)
+                        if repo_instance is not None:
+                            pending_commit = _run_in_background(
+                                repo_ops.commit_all, repo_instance, f"{step.get('title', 'Step')}\n\n{summary}"
+                            )
+                    except ValueError as diff_error:
+                        logger.error("invalid_diff_format", error=str(diff_error), step=step.get("title"))
+                        # Mark step as failed with specific error
+                        with session_scope() as session:
+                            step_model = repo.get_step(session, step_id)
+                            if step_model:
+                                repo.update_step(
+                                    session,
+                                    step_model,
+                                    status="failed",
+                                    details=f"Invalid diff format: {str(diff_error)[:200]}"
                                 )
-
-                                # Replace remaining plan with new plan
-                                plan = new_plan
-                                logger.info("replan_applied", job_id=job_id, new_steps=len(new_plan))
-
-                                # Continue to next step (from new plan)
-                                continue
-
-                            except Exception as replan_error:
-                                logger.error("replanning_failed", error=str(replan_error))
-                                raise replan_error
-                        else:
                             session.commit()
-
-                # Try fallback model if no replanning triggered
-                try:
-                    result = _run_coro(
-                        coder_agent.implement_step(
-                            job_task, step, messages=messages, model=settings.routing_fallback_model
+                        # Continue to next step instead of crashing
+                        continue
+                with session_scope() as session:
+                    job = repo.get_job(session, job_id)
+                    tokens_in = int(result.get("tokens_in", 0) or 0)
+                    tokens_out = int(result.get("tokens_out", 0) or 0)
+                    # Booked under the model that produced the result: routed, or the fallback
+                    if tokens_in or tokens_out:
+                        cost = _calculate_cost(model_name, tokens_in, tokens_out, price_rates)
+                        write_buffer.enqueue_cost(
+                            session,
+                            job,
+                            provider=provider_coder.name,
+                            model=model_name,
+                            tokens_in=tokens_in,
+                            tokens_out=tokens_out,
+                            cost_usd=cost,
                         )
+                    write_buffer.enqueue_summary(
+                        job_id=job_id,
+                        step_id=step_id,
+                        role="coder-step",
+                        summary=summary[:2000],
+                        tokens=tokens_out,
                     )
-                    model_name = settings.routing_fallback_model
-                    logger.info("coder_step_fallback_success", fallback_model=model_name)
-                except Exception as fallback_error:
-                    logger.error("coder_step_fallback_failed", error=str(fallback_error))
+                    job.last_action = summary or step.get("title")
+                    session.add(job)
+                    step_model = repo.get_step(session, step_id)
+                    if step_model:
+                        # Reset retry count on success
+                        step_model.retry_count = 0
+                        repo.update_step(session, step_model, status="completed", details=summary)
 
-                    # Increment retry count again for fallback failure
-                    with session_scope() as session:
-                        step_model = repo.get_step(session, step_id)
-                        if step_model:
-                            step_model.retry_count = (step_model.retry_count or 0) + 1
-                            session.add(step_model)
-                            session.commit()
+                    # Record progress and reset failures
+                    stall_detector.record_progress(job, session)
+                    job.consecutive_failures = 0
+                    session.add(job)
 
-                    # Continue to next step instead of raising
-                    continue
-            diff_text = result.get("diff", "")
-            summary = result.get("summary", "")
-            if diff_text:
-                try:
-                    _apply_diff(Path(repo_path), diff_text)
-                    if repo_instance is not None:
-                        repo_ops.commit_all(repo_instance, f"{step.get('title', 'Step')}\n\n{summary}")
-                except ValueError as diff_error:
-                    logger.error("invalid_diff_format", error=str(diff_error), step=step.get("title"))
-                    # Mark step as failed with specific error
-                    with session_scope() as session:
-                        step_model = repo.get_step(session, step_id)
-                        if step_model:
-                            repo.update_step(
-                                session,
-                                step_model,
-                                status="failed",
-                                details=f"Invalid diff format: {str(diff_error)[:200]}"
-                            )
-                        session.commit()
-                    # Continue to next step instead of crashing
-                    continue
-            with session_scope() as session:
-                job = repo.get_job(session, job_id)
-                tokens_in = int(result.get("tokens_in", 0) or 0)
-                tokens_out = int(result.get("tokens_out", 0) or 0)
-                model_name = model_coder
-                if tokens_in or tokens_out:
-                    cost = _calculate_cost(model_name, tokens_in, tokens_out)
-                    repo.increment_costs(
-                        session,
-                        job,
-                        provider=provider_coder.name,
-                        model=model_name,
-                        tokens_in=tokens_in,
-                        tokens_out=tokens_out,
-                        cost_usd=cost,
-                    )
-                repo.add_message_summary(
-                    session,
-                    job_id=job_id,
-                    step_id=step_id,
-                    role="coder-step",
-                    summary=summary[:2000],
-                    tokens=tokens_out,
-                )
-                job.last_action = summary or step.get("title")
-                session.add(job)
-                step_model = repo.get_step(session, step_id)
-                if step_model:
-                    # Reset retry count on success
-                    step_model.retry_count = 0
-                    repo.update_step(session, step_model, status="completed", details=summary)
-
-                # Record progress and reset failures
-                stall_detector.record_progress(job, session)
-                job.consecutive_failures = 0
-                session.add(job)
-                session.commit()
+                    # Ledger rows go out in bulk at the batch boundary, or earlier when the buffer fills
+                    if item is prepared[-1] or write_buffer.should_flush():
+                        write_buffer.flush(session)
+                    session.commit()
+
+            if write_buffer:
+                # The batch's last step bailed out early; write what the others queued
+                with session_scope() as session:
+                    write_buffer.flush(session)
+
+        if pending_commit is not None:
+            pending_commit.result()
         if not settings.dry_run and repo_instance is not None:
             with session_scope() as session:
                 job = repo.get_job(session, job_id)
@@ -492,7 +769,9 @@ def execute_job(self, job_id: str):
                 # Extract job.id for use outside session
                 job_display_id = job.id
             repo_ops.push_branch(repo_instance, feature_branch)
-            context_report = _format_context_report(last_context_diag)
+            context_report = (
+                _format_context_report(last_context_diag) if context_engine is not None else _CONTEXT_DISABLED_REPORT
+            )
             pr_body = (
                 f"Job {job_display_id} completed.\n"
                 f"Agents hash current: {spec.digest}\n"
@@ -519,11 +798,17 @@ def execute_job(self, job_id: str):
                 session.commit()
     except Exception as exc:
         logger.exception("job_failed", job_id=job_id)
+        # Mark the job first: if exc was a DB error, the buffered rows may not flush either
         with session_scope() as session:
             job = repo.get_job(session, job_id)
             if job:
                 repo.update_job_status(session, job, JobStatus.FAILED)
                 session.commit()
+        try:
+            with session_scope() as session:
+                write_buffer.flush(session)
+        except Exception:
+            logger.exception("write_buffer_flush_failed", job_id=job_id)
         raise exc
 
 
@@ -10,8 +10,7 @@ from app.core.logging import get_logger
 from app.db import repo
 from app.db.engine import session_scope
 from app.db.models import JobModel, JobStatus
-from app.llm.litellm_provider import LiteLLMProvider
-from app.llm.openai_provider import OpenAILLMProvider
+from app.llm.factory import get_provider
 
 logger = get_logger(__name__)
 
@@ -90,12 +89,7 @@ async def trigger_replanning(
     # Call CTO agent
     spec = parse_agents_file()
 
-    # Use appropriate provider
-    if settings.llm_routing_enabled:
-        provider = LiteLLMProvider()
-    else:
-        provider = OpenAILLMProvider()
-
+    provider = get_provider(settings.dry_run)
     cto_agent = CTOAgent(provider, spec, model_cto, dry_run=settings.dry_run)
 
     section = spec.section("CTO-AI")
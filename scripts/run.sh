@@ -76,7 +76,7 @@ trap cleanup EXIT INT TERM
 log 'Starte API und Worker (Ctrl+C zum Beenden)...'
 uv run uvicorn app.main:app --host 0.0.0.0 --port "$APP_PORT" &
 PIDS+=($!)
-# Worker findet Tasks automatisch via app.workers.celery_app Import
+# Worker registriert Tasks beim Start via include in app.workers.celery_app
 uv run celery -A app.workers.celery_app worker -l info &
 PIDS+=($!)
 
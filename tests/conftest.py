@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core import config
+from app.db import engine as db_engine_module
+from app.db.models import Base
+
+
+@pytest.fixture(scope="session")
+def db_engine() -> Generator[Engine, None, None]:
+    """In-memory database with the schema created once per test session"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    # pysqlite defers BEGIN on its own, which breaks SAVEPOINTs; let SQLAlchemy emit it
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, _record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def app_db(db_engine: Engine, monkeypatch: pytest.MonkeyPatch) -> Engine:
+    """
+    Point app.db.engine at the in-memory database for tests that drive the app.
+
+    The app opens its own transactions on the engine (startup create_all, the
+    health check), so there is no outer transaction and rows outlive the test.
+    """
+    monkeypatch.setattr(db_engine_module, "_engine", db_engine)
+    monkeypatch.setattr(db_engine_module, "_SessionLocal", sessionmaker(bind=db_engine, autoflush=False))
+    return db_engine
+
+
+@pytest.fixture()
+def db_session(db_engine: Engine, monkeypatch: pytest.MonkeyPatch) -> Generator[Session, None, None]:
+    """
+    Session inside an outer transaction that is rolled back after the test.
+
+    app.db.engine is pointed at the same connection, so session_scope() in the
+    code under test shares it; every commit only releases a SAVEPOINT.
+    """
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    factory = sessionmaker(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
+    monkeypatch.setattr(db_engine_module, "_engine", db_engine)
+    monkeypatch.setattr(db_engine_module, "_SessionLocal", factory)
+    session = factory()
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture()
+def dry_run_settings(monkeypatch: pytest.MonkeyPatch) -> Generator[config.AppSettings, None, None]:
+    """Fresh settings with DRY_RUN on; extra variables can be set before requesting it"""
+    monkeypatch.setenv("REDIS_URL", "redis://localhost:6379/0")
+    monkeypatch.setenv("DRY_RUN", "true")
+    config.get_settings.cache_clear()
+    try:
+        yield config.get_settings()
+    finally:
+        config.get_settings.cache_clear()
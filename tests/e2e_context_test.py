@@ -14,9 +14,7 @@ from app.workers import job_worker
 
 
 @pytest.fixture(autouse=True)
-def setup_env(tmp_path, monkeypatch):
-    db_path = tmp_path / "orchestrator.db"
-    monkeypatch.setenv("DB_PATH", str(db_path))
+def setup_env(app_db, monkeypatch):
     monkeypatch.setenv("GITHUB_OWNER", "demo")
     monkeypatch.setenv("GITHUB_REPO", "demo-repo")
     monkeypatch.setenv("MEMORY_MAX_ITEMS_PER_JOB", "10")
@@ -13,9 +13,7 @@ from app.workers import job_worker
 
 
 @pytest.fixture(autouse=True)
-def setup_env(tmp_path, monkeypatch):
-    db_path = tmp_path / "orchestrator.db"
-    monkeypatch.setenv("DB_PATH", str(db_path))
+def setup_env(app_db, monkeypatch):
     monkeypatch.setenv("GITHUB_OWNER", "demo")
     monkeypatch.setenv("GITHUB_REPO", "demo-repo")
     config.get_settings.cache_clear()
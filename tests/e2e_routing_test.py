@@ -5,189 +5,135 @@ import pytest
 
 from app.core.config import get_settings
 from app.db import repo
-from app.db.engine import session_scope
-from app.db.models import CostEntryModel
-from app.workers.job_worker import execute_job
+from app.db.models import CostEntryModel, JobModel
+from app.workers import job_worker
 
 
-@pytest.fixture
-def enable_routing():
-    """Enable routing for tests"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    original_dry_run = settings.dry_run
+@pytest.fixture(scope="module")
+def settings():
+    """Settings object for this module; fetched once, after earlier modules may have reloaded it"""
+    return get_settings()
 
-    settings.llm_routing_enabled = True
-    settings.dry_run = True
 
-    yield
+@pytest.fixture(params=[True, False], ids=["routing-on", "routing-off"])
+def routing_mode(request, settings, monkeypatch):
+    """Dry-run mode with routing on or off; tests pin one mode via indirect parametrization"""
+    monkeypatch.setattr(settings, "dry_run", True)
+    monkeypatch.setattr(settings, "llm_routing_enabled", request.param)
+    return request.param
 
-    settings.llm_routing_enabled = original_routing
-    settings.dry_run = original_dry_run
 
+def _plan_single_step(monkeypatch, title: str, **fields) -> None:
+    """Have the CTO plan exactly one step, so the job's coder call is routed on that title"""
 
-def test_routing_workflow_with_mixed_complexity(enable_routing):
+    async def create_plan(self, task, *, messages=None):
+        return [{"title": title, **fields}], 0, 0
+
+    monkeypatch.setattr(job_worker.CTOAgent, "create_plan", create_plan)
+
+
+def _coder_models(db_session, job_id: str) -> list[str]:
+    """Models of the job's ledger rows; the scripted plan books nothing, so these are coder calls"""
+    costs = db_session.query(CostEntryModel).filter(CostEntryModel.job_id == job_id).all()
+    return [cost.model for cost in costs]
+
+
+def _create_job(db_session, **overrides) -> JobModel:
+    """Create a job with test defaults; flushed only, the test's outer transaction is never committed"""
+    fields = dict(
+        task="Test task",
+        repo_owner="test",
+        repo_name="test-repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=50,
+        max_minutes=30,
+        model_cto="gpt-4.1-mini",
+        model_coder=None,  # Will be routed
+        agents_hash="test-hash",
+    )
+    fields.update(overrides)
+    job = repo.create_job(db_session, **fields)
+    # Visible to the worker's sessions, which share this connection
+    db_session.flush()
+    return job
+
+
+def _run_job(db_session, **overrides) -> str:
+    """Create a job, run the dry-run pipeline on it and return its id"""
+    job_id = _create_job(db_session, **overrides).id
+
+    job_worker.execute_job(job_id)
+
+    # The worker wrote through its own sessions on the same connection
+    db_session.expire_all()
+    return job_id
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("routing_mode", [True], indirect=True)
+def test_routing_workflow_with_mixed_complexity(routing_mode, db_session):
     """
     Full workflow with routing enabled in dry-run mode.
     Verifies that different models are selected based on complexity.
     """
-    settings = get_settings()
-
-    with session_scope() as session:
-        job = repo.create_job(
-            session,
-            task="Create tests and refactor database schema",
-            repo_owner="test",
-            repo_name="test-repo",
-            branch_base="main",
-            budget_usd=5.0,
-            max_requests=50,
-            max_minutes=30,
-            model_cto="gpt-4.1-mini",
-            model_coder=None,  # Will be routed
-            agents_hash="test-hash",
-        )
-        session.commit()
-        job_id = job.id
-
-    # Execute job (dry-run mode)
-    execute_job(job_id)
-
-    with session_scope() as session:
-        job = repo.get_job(session, job_id)
-        costs = session.query(CostEntryModel).filter(CostEntryModel.job_id == job_id).all()
-
-        # Verify job completed
-        assert job.status in ["completed", "failed"]
-
-        # Verify cost tracking exists
-        assert len(costs) > 0
-
-        # In dry-run mode, models should still be logged
-        # (DryRunProvider is used, but routing decision is made)
-        models_used = {cost.model for cost in costs}
-
-        # Verify at least one model was tracked
-        assert len(models_used) >= 1
-
-
-def test_routing_respects_budget_limits(enable_routing):
-    """Verify that routing downgrades models when budget is low"""
-    settings = get_settings()
-
-    with session_scope() as session:
-        job = repo.create_job(
-            session,
-            task="Complex architectural refactoring",
-            repo_owner="test",
-            repo_name="test-repo",
-            branch_base="main",
-            budget_usd=0.5,  # Very low budget
-            max_requests=50,
-            max_minutes=30,
-            model_cto="gpt-4.1-mini",
-            model_coder=None,
-            agents_hash="test-hash",
-        )
-        session.commit()
-        job_id = job.id
-
-    execute_job(job_id)
-
-    with session_scope() as session:
-        job = repo.get_job(session, job_id)
-
-        # Verify job didn't exceed budget
-        assert job.cost_usd <= job.budget_usd
-
-        # Verify job completed (even with tight budget)
-        assert job.status in ["completed", "failed"]
-
-
-def test_routing_auto_detects_complexity():
+    job_id = _run_job(db_session, task="Create tests and refactor database schema")
+
+    job = repo.get_job(db_session, job_id)
+    costs = db_session.query(CostEntryModel).filter(CostEntryModel.job_id == job_id).all()
+
+    # Verify job completed
+    assert job.status in ["completed", "failed"]
+
+    # Verify cost tracking exists
+    assert len(costs) > 0
+
+    # In dry-run mode, models should still be logged
+    # (DryRunProvider is used, but routing decision is made)
+    models_used = {cost.model for cost in costs}
+
+    # Verify at least one model was tracked
+    assert len(models_used) >= 1
+
+
+@pytest.mark.parametrize("routing_mode", [True], indirect=True)
+def test_routing_downgrades_model_on_low_budget(routing_mode, db_session, settings, monkeypatch):
+    """A complex step is routed to a cheaper tier when its model would overspend the budget"""
+    task = "Fix authentication security issue"
+    # A ~11k token prompt puts the complex model's estimate (~$0.32) above the $0.30 per-step
+    # share of a $0.60 budget, which still passes the budget guard's flat $0.50 step estimate
+    _plan_single_step(monkeypatch, task, rationale="Session handling is spread across modules. " * 1000)
+
+    job_id = _run_job(db_session, task=task, budget_usd=0.6)
+
+    job = repo.get_job(db_session, job_id)
+    assert job.status == "completed"
+    assert _coder_models(db_session, job_id) == [settings.model_medium]
+    assert job.cost_usd <= job.budget_usd
+
+
+@pytest.mark.parametrize("routing_mode", [True], indirect=True)
+def test_routing_auto_detects_complexity(routing_mode, db_session, settings, monkeypatch):
     """
     Verify that router auto-detects complexity from step titles
     when CTO doesn't provide explicit complexity field.
     """
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    original_dry_run = settings.dry_run
-
-    settings.llm_routing_enabled = True
-    settings.dry_run = True
-
-    try:
-        with session_scope() as session:
-            job = repo.create_job(
-                session,
-                task="Write unit tests for authentication module",
-                repo_owner="test",
-                repo_name="test-repo",
-                branch_base="main",
-                budget_usd=5.0,
-                max_requests=50,
-                max_minutes=30,
-                model_cto="gpt-4.1-mini",
-                model_coder=None,
-                agents_hash="test-hash",
-            )
-            session.commit()
-            job_id = job.id
-
-        execute_job(job_id)
-
-        with session_scope() as session:
-            job = repo.get_job(session, job_id)
-
-            # Task contains "test" keyword, should be detected as low complexity
-            # and use cheaper model (verified through logs in actual run)
-            assert job.status in ["completed", "failed"]
-            assert job.cost_usd <= job.budget_usd
-
-    finally:
-        settings.llm_routing_enabled = original_routing
-        settings.dry_run = original_dry_run
-
-
-def test_fallback_on_routing_disabled():
+    task = "Write unit tests for authentication module"
+    _plan_single_step(monkeypatch, task)
+
+    job_id = _run_job(db_session, task=task)
+
+    # "authentication" outranks "test", so the step lands in the complex tier
+    job = repo.get_job(db_session, job_id)
+    assert _coder_models(db_session, job_id) == [settings.model_complex]
+    assert job.cost_usd <= job.budget_usd
+
+
+@pytest.mark.parametrize("routing_mode", [False], indirect=True)
+def test_fallback_on_routing_disabled(routing_mode, db_session, monkeypatch):
     """When routing is disabled, should fall back to model_coder"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    original_dry_run = settings.dry_run
-
-    settings.llm_routing_enabled = False
-    settings.dry_run = True
-
-    try:
-        with session_scope() as session:
-            job = repo.create_job(
-                session,
-                task="Test task",
-                repo_owner="test",
-                repo_name="test-repo",
-                branch_base="main",
-                budget_usd=5.0,
-                max_requests=50,
-                max_minutes=30,
-                model_cto="gpt-4.1-mini",
-                model_coder="gpt-4.1",  # Should use this when routing disabled
-                agents_hash="test-hash",
-            )
-            session.commit()
-            job_id = job.id
-
-        execute_job(job_id)
-
-        with session_scope() as session:
-            job = repo.get_job(session, job_id)
-            costs = session.query(CostEntryModel).filter(CostEntryModel.job_id == job_id).all()
-
-            # Verify job completed
-            assert job.status in ["completed", "failed"]
-
-            # In dry-run with routing disabled, should still track costs
-            assert len(costs) > 0
-
-    finally:
-        settings.llm_routing_enabled = original_routing
-        settings.dry_run = original_dry_run
+    _plan_single_step(monkeypatch, "Test task")
+
+    job_id = _run_job(db_session, model_coder="gpt-4.1")  # Should use this when routing disabled
+
+    assert _coder_models(db_session, job_id) == ["gpt-4.1"]
@@ -0,0 +1,17 @@
+from sqlalchemy import create_engine
+
+from app.db.engine import _pool_options
+
+
+def test_pool_options_use_lifo_for_file_database(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'orchestrator.db'}"
+
+    assert _pool_options(uri) == {"pool_use_lifo": True}
+    create_engine(uri, **_pool_options(uri)).dispose()
+
+
+def test_pool_options_skip_lifo_for_memory_database():
+    uri = "sqlite:///:memory:"
+
+    assert _pool_options(uri) == {}
+    create_engine(uri, **_pool_options(uri)).dispose()
@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import pytest
+
+from app.core.pricing import PricingTable
+from app.db import repo
+from app.db.models import JobStatus
+from app.llm.provider import LLMBudgetExceeded
+from app.workers import job_worker
+from app.workers.job_worker import _abandon_steps, _book_cancelled_call, _calculate_cost
+
+
+def test_abandon_steps_fails_steps_left_running(db_session):
+    job = repo.create_job(
+        db_session,
+        task="Task",
+        repo_owner="owner",
+        repo_name="repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=10,
+        max_minutes=30,
+        model_cto=None,
+        model_coder=None,
+        agents_hash=None,
+    )
+    step = repo.create_step(db_session, job, "Implement", "execution")
+    repo.update_step(db_session, step, status="running")
+    db_session.commit()
+
+    _abandon_steps([step.id], "Not run: job stalled")
+
+    db_session.expire_all()
+    step = repo.get_step(db_session, step.id)
+    assert step.status == "failed"
+    assert step.details == "Not run: job stalled"
+    assert step.finished_at is not None
+
+
+def test_cancelled_call_books_prompt_and_partial_output(db_session):
+    job = repo.create_job(
+        db_session,
+        task="Task",
+        repo_owner="owner",
+        repo_name="repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=10,
+        max_minutes=30,
+        model_cto=None,
+        model_coder=None,
+        agents_hash=None,
+    )
+    db_session.commit()
+    error = LLMBudgetExceeded("gpt-4.1", 100, tokens_in=1000, tokens_out=101)
+
+    _book_cancelled_call(job.id, "litellm", error, {"gpt-4.1": (0.001, 0.002)})
+
+    db_session.expire_all()
+    job = repo.get_job(db_session, job.id)
+    assert (job.tokens_in, job.tokens_out, job.requests_made) == (1000, 101, 1)
+    assert job.cost_usd == pytest.approx(1000 * 0.001 + 101 * 0.002)
+
+
+def test_calculate_cost_falls_back_to_default_pricing(monkeypatch):
+    table = PricingTable({"default": {"input": 0.002, "output": 0.004}})
+    monkeypatch.setattr(job_worker, "get_pricing_table", lambda: table)
+
+    assert _calculate_cost("unlisted-model", 1000, 1000) == pytest.approx(0.006)
+
+
+@pytest.fixture()
+def dry_run_worker(db_session, monkeypatch, tmp_path, request):
+    """Run execute_job in dry run from a scratch directory; the coder is replaced per test"""
+    monkeypatch.setenv("MAX_STEP_RETRIES", "1")
+    (tmp_path / "AGENTS.md").write_text(Path("AGENTS.md").read_text(encoding="utf-8"), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    request.getfixturevalue("dry_run_settings")
+    job = repo.create_job(
+        db_session,
+        task="Task",
+        repo_owner="owner",
+        repo_name="repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=50,
+        max_minutes=30,
+        model_cto=None,
+        model_coder=None,
+        agents_hash=None,
+    )
+    db_session.commit()
+    return job
+
+
+def _script_plan(monkeypatch, plan):
+    async def create_plan(self, task, *, messages=None):
+        return [dict(step) for step in plan], 0, 0
+
+    monkeypatch.setattr(job_worker.CTOAgent, "create_plan", create_plan)
+
+
+def test_replan_replaces_remaining_batches(db_session, dry_run_worker, monkeypatch):
+    _script_plan(monkeypatch, [{"title": "fails"}, {"title": "stale"}])
+    implemented = []
+
+    async def implement_step(self, task, step, *, messages=None, model=None, output_token_budget=None):
+        implemented.append(step["title"])
+        if step["title"] == "fails":
+            raise RuntimeError("bad diff")
+        return {"diff": "", "summary": "done", "tokens_in": 0, "tokens_out": 0}
+
+    async def trigger_replanning(job_id, reason, failed_step_name=None):
+        return [{"title": "replanned", "files": ["a.py"]}, {"title": "also replanned", "files": ["b.py"]}]
+
+    monkeypatch.setattr(job_worker.CoderAgent, "implement_step", implement_step)
+    monkeypatch.setattr(job_worker, "trigger_replanning", trigger_replanning)
+
+    job_worker.execute_job(dry_run_worker.id)
+
+    assert implemented == ["fails", "replanned", "also replanned"]
+    db_session.expire_all()
+    assert repo.get_job(db_session, dry_run_worker.id).status == JobStatus.COMPLETED
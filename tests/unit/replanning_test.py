@@ -0,0 +1,35 @@
+import asyncio
+
+from app.db import repo
+from app.db.models import JobStatus
+from app.workers.replanning import trigger_replanning
+
+
+def test_replanning_books_cto_call(db_session, dry_run_settings):
+    job = repo.create_job(
+        db_session,
+        task="Add a health endpoint",
+        repo_owner="owner",
+        repo_name="repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=10,
+        max_minutes=30,
+        model_cto=None,
+        model_coder=None,
+        agents_hash=None,
+    )
+    db_session.commit()
+
+    plan = asyncio.run(trigger_replanning(job.id, "Step failed 3 times", "Implement"))
+
+    assert plan
+    db_session.expire_all()
+    job = repo.get_job(db_session, job.id)
+    assert job.status == JobStatus.RUNNING
+    assert job.replan_count == 1
+    assert job.requests_made == 1
+    assert job.tokens_in > 0
+    [entry] = job.costs
+    assert entry.provider == "dry-run"
+    assert entry.model == dry_run_settings.model_cto
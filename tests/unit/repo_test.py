@@ -0,0 +1,27 @@
+from app.db import repo
+
+
+def test_insert_planned_steps_records_completed_plan_steps(db_session):
+    job = repo.create_job(
+        db_session,
+        task="Task",
+        repo_owner="owner",
+        repo_name="repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=10,
+        max_minutes=30,
+        model_cto=None,
+        model_coder=None,
+        agents_hash=None,
+    )
+
+    repo.insert_planned_steps(db_session, job, ["Setup", "Implement"])
+    db_session.commit()
+
+    steps = list(repo.get_steps(db_session, job.id))
+    assert [step.name for step in steps] == ["Setup", "Implement"]
+    assert len({step.id for step in steps}) == 2
+    assert all(step.step_type == "plan" and step.status == "completed" for step in steps)
+    assert all(step.details == "planned" and step.finished_at is not None for step in steps)
+    assert all(step.retry_count == 0 and step.edit_history == [] for step in steps)
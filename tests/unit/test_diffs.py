@@ -12,3 +12,24 @@ def test_apply_unified_diff(tmp_path):
     for path, content in apply_unified_diff(tmp_path, diff):
         safe_write(path, content)
     assert file_path.read_text(encoding="utf-8") == updated
+
+
+def test_safe_write_streams_chunks_and_keeps_mode(tmp_path):
+    file_path = tmp_path / "run.sh"
+    file_path.write_text("old\n", encoding="utf-8")
+    file_path.chmod(0o755)
+    safe_write(file_path, iter(["echo\n", "done\n"]))
+    assert file_path.read_text(encoding="utf-8") == "echo\ndone\n"
+    assert file_path.stat().st_mode & 0o777 == 0o755
+    assert [entry.name for entry in tmp_path.iterdir()] == ["run.sh"]
+
+
+def test_safe_write_leaves_tracked_tmp_sibling_alone(tmp_path):
+    """A repo file named like a temp file must survive the write next to it"""
+    sibling = tmp_path / "config.py.tmp"
+    sibling.write_text("keep\n", encoding="utf-8")
+    file_path = tmp_path / "config.py"
+    safe_write(file_path, "value = 1\n")
+    assert file_path.read_text(encoding="utf-8") == "value = 1\n"
+    assert sibling.read_text(encoding="utf-8") == "keep\n"
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["config.py", "config.py.tmp"]
@@ -1,8 +1,9 @@
+import time
 from datetime import datetime, timedelta
 
 import pytest
 
-from app.workers.job_worker import _check_limits
+from app.workers.job_worker import _check_limits, _job_deadline
 
 
 class DummyJob:
@@ -17,17 +18,30 @@ class DummyJob:
 
 def test_check_limits_passes():
     job = DummyJob(1.0, 5.0, 10, 20, datetime.utcnow(), 60)
-    _check_limits(job, now=datetime.utcnow())
+    _check_limits(job, deadline=_job_deadline(job))
 
 
 def test_check_limits_budget_exceeded():
     job = DummyJob(5.0, 5.0, 0, 20, datetime.utcnow(), 60)
     with pytest.raises(RuntimeError):
-        _check_limits(job, now=datetime.utcnow())
+        _check_limits(job, deadline=_job_deadline(job))
 
 
 def test_check_limits_time_exceeded():
     started = datetime.utcnow() - timedelta(minutes=120)
     job = DummyJob(1.0, 5.0, 0, 20, started, 60)
     with pytest.raises(RuntimeError):
-        _check_limits(job, now=datetime.utcnow())
+        _check_limits(job, deadline=_job_deadline(job))
+
+
+def test_job_deadline_accounts_for_elapsed_time():
+    started = datetime.utcnow() - timedelta(minutes=30)
+    job = DummyJob(1.0, 5.0, 0, 20, started, 60)
+    remaining = _job_deadline(job) - time.monotonic()
+    assert 29 * 60 < remaining <= 30 * 60
+
+
+def test_job_deadline_without_start():
+    job = DummyJob(1.0, 5.0, 0, 20, None, 60)
+    assert _job_deadline(job) is None
+    _check_limits(job, deadline=None)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.llm import litellm_provider
+from app.llm.litellm_provider import LiteLLMProvider
+from app.llm.provider import LLMBudgetExceeded
+
+
+class _FakeStream:
+    """Async iterator only, like the locked litellm's CustomStreamWrapper"""
+
+    def __init__(self, deltas):
+        self.deltas = list(deltas)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.deltas:
+            raise StopAsyncIteration
+        delta = self.deltas.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))], usage=None)
+
+
+class _ClosableStream(_FakeStream):
+    def __init__(self, deltas):
+        super().__init__(deltas)
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _patch_stream(monkeypatch, stream):
+    async def acompletion(**kwargs):
+        assert kwargs["stream"] is True
+        return stream
+
+    monkeypatch.setattr(litellm_provider.litellm, "acompletion", acompletion)
+
+
+def test_stream_within_budget_returns_full_text(monkeypatch):
+    stream = _FakeStream(["abcd", "efgh"])
+    _patch_stream(monkeypatch, stream)
+
+    response = asyncio.run(
+        LiteLLMProvider().generate(model="gpt-4.1", messages=[{"role": "user", "content": "hi"}], output_token_budget=10)
+    )
+
+    assert response.text == "abcdefgh"
+    assert response.tokens_out == 2
+
+
+def test_stream_over_budget_is_cancelled(monkeypatch):
+    stream = _ClosableStream(["abcd" * 3, "never read"])
+    _patch_stream(monkeypatch, stream)
+
+    with pytest.raises(LLMBudgetExceeded) as excinfo:
+        asyncio.run(
+            LiteLLMProvider().generate(
+                model="gpt-4.1", messages=[{"role": "user", "content": "hi"}], output_token_budget=2
+            )
+        )
+
+    # The prompt and the partial output are reported so the caller can book them
+    assert excinfo.value.tokens_in > 0
+    assert excinfo.value.tokens_out == 3
+    assert stream.closed
+    assert stream.deltas == ["never read"]
+
+
+def test_stream_over_budget_without_aclose_still_reports_usage(monkeypatch):
+    _patch_stream(monkeypatch, _FakeStream(["abcd" * 3, "never read"]))
+
+    with pytest.raises(LLMBudgetExceeded) as excinfo:
+        asyncio.run(
+            LiteLLMProvider().generate(
+                model="gpt-4.1", messages=[{"role": "user", "content": "hi"}], output_token_budget=2
+            )
+        )
+
+    assert excinfo.value.tokens_out == 3
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+from redis.exceptions import RedisError
+
+from app.llm import cache
+from app.llm.cache import CachedLLMProvider, response_cache_key
+from app.llm.provider import BaseLLMProvider, LLMResponse
+
+
+class _CountingProvider(BaseLLMProvider):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, *, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> LLMResponse:
+        self.calls += 1
+        return LLMResponse(text="ok", tokens_in=10, tokens_out=5)
+
+
+def test_cache_key_is_stable_and_scoped():
+    """Same call yields the same key; namespace, model and params change it"""
+    messages = [{"role": "system", "content": "Plan the task"}]
+
+    key = response_cache_key("owner/repo", "gpt-4.1", messages)
+
+    assert key == response_cache_key("owner/repo", "gpt-4.1", [dict(messages[0])])
+    assert key.startswith("llm-cache:owner/repo:")
+    assert key != response_cache_key("other/repo", "gpt-4.1", messages)
+    assert key != response_cache_key("owner/repo", "gpt-4", messages)
+    assert key != response_cache_key("owner/repo", "gpt-4.1", messages, temperature=0.2)
+
+
+def test_volatile_prompts_bypass_cache():
+    """Prompts with UUIDs or timestamps go straight to the wrapped provider"""
+    inner = _CountingProvider()
+    provider = CachedLLMProvider(inner, namespace="owner/repo", ttl_seconds=60)
+    messages = [{"role": "system", "content": "Job 123e4567-e89b-12d3-a456-426614174000"}]
+
+    response = asyncio.run(provider.generate(model="gpt-4.1", messages=messages))
+
+    assert inner.calls == 1
+    assert response.tokens_in == 10
+    assert provider.name == "counting"
+
+
+class _DictRedis:
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+
+    def get(self, key: str):
+        return self.data.get(key)
+
+    def set(self, key: str, value: bytes, ex: int | None = None):
+        self.data[key] = value
+
+
+def test_cache_hit_costs_no_tokens(monkeypatch):
+    """A repeated request is answered from Redis without calling the provider"""
+    redis = _DictRedis()
+    monkeypatch.setattr(cache, "_get_redis", lambda: redis)
+    monkeypatch.setattr(cache, "_redis_down_until", 0.0)
+    inner = _CountingProvider()
+    provider = CachedLLMProvider(inner, namespace="owner/repo", ttl_seconds=60)
+    messages = [{"role": "system", "content": "Plan the task"}]
+
+    first = asyncio.run(provider.generate(model="gpt-4.1", messages=messages))
+    second = asyncio.run(provider.generate(model="gpt-4.1", messages=messages))
+
+    assert inner.calls == 1
+    assert second.text == first.text == "ok"
+    assert (first.tokens_in, second.tokens_in) == (10, 0)
+
+
+class _DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, key: str):
+        self.calls += 1
+        raise RedisError("connection refused")
+
+
+def test_unavailable_redis_is_skipped_until_retry(monkeypatch):
+    """A Redis error falls through to the provider and bypasses Redis for the following calls"""
+    redis = _DownRedis()
+    monkeypatch.setattr(cache, "_get_redis", lambda: redis)
+    monkeypatch.setattr(cache, "_redis_down_until", 0.0)
+    inner = _CountingProvider()
+    provider = CachedLLMProvider(inner, namespace="owner/repo", ttl_seconds=60)
+    messages = [{"role": "system", "content": "Plan the task"}]
+
+    for _ in range(3):
+        response = asyncio.run(provider.generate(model="gpt-4.1", messages=messages))
+
+    assert response.text == "ok"
+    assert inner.calls == 3
+    assert redis.calls == 1
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+from app.llm.coalesce import CoalescingLLMProvider
+from app.llm.provider import BaseLLMProvider, LLMBudgetExceeded, LLMResponse
+
+
+class _SlowProvider(BaseLLMProvider):
+    name = "slow"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, *, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> LLMResponse:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        budget = kwargs.get("output_token_budget")
+        if budget is not None and budget < 5:
+            raise LLMBudgetExceeded(model, budget, tokens_in=10, tokens_out=budget + 1)
+        return LLMResponse(text="ok", tokens_in=10, tokens_out=5)
+
+
+MESSAGES = [{"role": "system", "content": "Plan the task"}]
+
+
+def _run_concurrently(provider, *budgets):
+    async def run():
+        calls = [
+            provider.generate(model="gpt-4.1", messages=MESSAGES, output_token_budget=budget) for budget in budgets
+        ]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_identical_concurrent_calls_are_coalesced():
+    """Concurrent identical requests share one provider call; only the first is billed"""
+    inner = _SlowProvider()
+    provider = CoalescingLLMProvider(inner)
+
+    first, second = _run_concurrently(provider, 100, 100)
+
+    assert inner.calls == 1
+    assert first.text == second.text == "ok"
+    assert (first.tokens_in, second.tokens_in) == (10, 0)
+    assert provider._inflight == {}
+
+
+def test_different_budgets_are_not_coalesced():
+    inner = _SlowProvider()
+
+    first, second = _run_concurrently(CoalescingLLMProvider(inner), 100, 200)
+
+    assert inner.calls == 2
+    assert (first.tokens_in, second.tokens_in) == (10, 10)
+
+
+def test_budget_cancel_is_billed_once():
+    """Followers of a cancelled call raise too, but report no usage of their own"""
+    inner = _SlowProvider()
+
+    first, second = _run_concurrently(CoalescingLLMProvider(inner), 2, 2)
+
+    assert inner.calls == 1
+    assert isinstance(first, LLMBudgetExceeded) and isinstance(second, LLMBudgetExceeded)
+    assert (first.tokens_in, first.tokens_out) == (10, 3)
+    assert (second.tokens_in, second.tokens_out) == (0, 0)
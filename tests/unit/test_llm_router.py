@@ -3,19 +3,33 @@ from __future__ import annotations
 import pytest
 
 from app.core.config import get_settings
+from app.core import pricing
+from app.core.pricing import PricingTable
 from app.db.models import JobModel
-from app.llm.router import LLMRouter, RoutingDecision
+from app.llm.router import LLMRouter, RoutingDecision, get_router
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
+def settings():
+    """Settings object for this module; fetched once, after earlier modules may have reloaded it"""
+    return get_settings()
+
+
+@pytest.fixture(autouse=True)
+def _routing_on(settings, monkeypatch):
+    """Routing is on for every test here; test_routing_disabled_uses_fallback turns it back off"""
+    monkeypatch.setattr(settings, "llm_routing_enabled", True)
+
+
+@pytest.fixture(scope="session")
 def router():
-    """Create LLMRouter instance"""
+    """Shared LLMRouter; tests only call it, and settings changes are read through the same settings object"""
     return LLMRouter()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def job_with_budget():
-    """Create JobModel with available budget"""
+    """Create JobModel with available budget; shared, so tests must only read it"""
     return JobModel(
         id="test-job-1",
         task="Test task",
@@ -29,9 +43,9 @@ def job_with_budget():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def job_low_budget():
-    """Create JobModel with low remaining budget"""
+    """Create JobModel with low remaining budget; shared, so tests must only read it"""
     return JobModel(
         id="test-job-2",
         task="Test task",
@@ -45,225 +59,139 @@ def job_low_budget():
     )
 
 
-def test_routing_disabled_uses_fallback(router, job_with_budget):
+def test_routing_disabled_uses_fallback(router, job_with_budget, settings, monkeypatch):
     """When routing disabled, should use legacy model_coder"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = False
-
-    try:
-        step = {"title": "Simple task", "complexity": 2}
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=500,
-            estimated_tokens_out=500,
-        )
-
-        assert decision.reason == "routing_disabled"
-        assert decision.complexity_score == 5  # Default when disabled
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_simple_task_routes_to_gpt35(router, job_with_budget):
-    """Simple tasks (complexity 1-3) should use GPT-3.5"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        step = {"title": "Write boilerplate tests", "complexity": 2}
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=500,
-            estimated_tokens_out=500,
-        )
-
-        assert decision.model == settings.model_simple
-        assert "simple" in decision.reason
-        assert decision.complexity_score == 2
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_medium_task_routes_to_sonnet(router, job_with_budget):
-    """Medium tasks (complexity 4-7) should use Claude Sonnet"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        step = {"title": "Implement feature", "complexity": 5}
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=1000,
-            estimated_tokens_out=1000,
-        )
-
-        assert decision.model == settings.model_medium
-        assert "medium" in decision.reason
-        assert decision.complexity_score == 5
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_complex_task_routes_to_opus(router, job_with_budget):
-    """Complex tasks (complexity 8-10) should use Claude Opus"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        step = {"title": "Redesign database architecture", "complexity": 9}
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=2000,
-            estimated_tokens_out=3000,
-        )
-
-        assert decision.model == settings.model_complex
-        assert "complex" in decision.reason
-        assert decision.complexity_score == 9
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_budget_constraint_downgrades_model(router, job_low_budget):
+    monkeypatch.setattr(settings, "llm_routing_enabled", False)
+
+    step = {"title": "Simple task", "complexity": 2}
+    decision = router.select_model(
+        step,
+        budget_usd=job_with_budget.budget_usd,
+        cost_usd=job_with_budget.cost_usd,
+        estimated_tokens_in=500,
+        estimated_tokens_out=500,
+    )
+
+    assert decision.reason == "routing_disabled"
+    assert decision.complexity_score == 5  # Default when disabled
+
+
+@pytest.mark.parametrize(
+    "step, tokens, expected_bucket, expected_complexity",
+    [
+        # Explicit complexity: 1-3 simple, 4-7 medium, 8-10 complex
+        ({"title": "Write boilerplate tests", "complexity": 2}, 500, "simple", 2),
+        ({"title": "Implement feature", "complexity": 5}, 1000, "medium", 5),
+        ({"title": "Redesign database architecture", "complexity": 9}, 2000, "complex", 9),
+        # Auto-detected from keywords: "test" -> 1, "architecture" -> 7
+        ({"title": "Write unit tests", "rationale": "Add test coverage"}, 500, "simple", 1),
+        ({"title": "Design distributed system architecture", "rationale": "Scalability requirements"}, 2000, "medium", 7),
+    ],
+    ids=["simple", "medium", "complex", "keywords-simple", "keywords-architecture"],
+)
+def test_routing_bucket(
+    router, job_with_budget, settings, step, tokens, expected_bucket, expected_complexity
+):
+    """Complexity, explicit or detected from keywords, selects the model tier"""
+    decision = router.select_model(
+        step,
+        budget_usd=job_with_budget.budget_usd,
+        cost_usd=job_with_budget.cost_usd,
+        estimated_tokens_in=tokens,
+        estimated_tokens_out=tokens,
+    )
+
+    assert decision.model == getattr(settings, f"model_{expected_bucket}")
+    assert expected_bucket in decision.reason
+    assert decision.complexity_score == expected_complexity
+
+
+def test_budget_constraint_downgrades_model(router, job_low_budget, settings):
     """Low budget should force downgrade to cheaper model"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        # Complex task that would normally use Opus
-        step = {"title": "Complex refactoring", "complexity": 8}
-        decision = router.select_model(
-            step,
-            budget_usd=job_low_budget.budget_usd,
-            cost_usd=job_low_budget.cost_usd,
-            estimated_tokens_in=1000,
-            estimated_tokens_out=1000,
-        )
-
-        # Should downgrade due to budget
-        assert decision.model != settings.model_complex
-        assert "budget_downgrade" in decision.reason
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_large_token_count_upgrades_model(router, job_with_budget):
+    # Complex task that would normally use Opus
+    step = {"title": "Complex refactoring", "complexity": 8}
+    decision = router.select_model(
+        step,
+        budget_usd=job_low_budget.budget_usd,
+        cost_usd=job_low_budget.cost_usd,
+        estimated_tokens_in=1000,
+        estimated_tokens_out=1000,
+    )
+
+    # Should downgrade due to budget
+    assert decision.model != settings.model_complex
+    assert "budget_downgrade" in decision.reason
+
+
+def test_budget_constraint_downgrades_through_tiers(router, settings):
+    """Very low budget should walk a complex task down to the simple model"""
+    step = {"title": "Complex refactoring", "complexity": 8}
+    decision = router.select_model(
+        step,
+        budget_usd=2.0,
+        cost_usd=1.99,  # Only $0.005 per step allowed
+        estimated_tokens_in=1000,
+        estimated_tokens_out=1000,
+    )
+
+    assert decision.model == settings.model_simple
+    assert decision.reason == "budget_downgrade_from_medium"
+
+
+def test_large_token_count_upgrades_model(router, job_with_budget, settings):
     """Large token count should upgrade from simple to medium"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        # Simple task but with large token count
-        step = {"title": "Write tests", "complexity": 2}
-        large_tokens = settings.routing_token_threshold_large + 1000
-
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=large_tokens,
-            estimated_tokens_out=large_tokens,
-        )
-
-        # Should upgrade from simple to medium
-        assert decision.model == settings.model_medium
-        assert "token_upgrade" in decision.reason
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_auto_detect_complexity_from_keywords(router, job_with_budget):
-    """Should auto-detect complexity from keywords when not provided"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        # Step without explicit complexity field
-        step = {"title": "Write unit tests", "rationale": "Add test coverage"}
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=500,
-            estimated_tokens_out=500,
-        )
-
-        # Should detect "test" keyword → complexity 1
-        assert decision.complexity_score == 1
-        assert decision.model == settings.model_simple
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_auto_detect_architecture_task(router, job_with_budget):
-    """Should auto-detect high complexity for architecture tasks"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        step = {
-            "title": "Design distributed system architecture",
-            "rationale": "Scalability requirements",
-        }
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=2000,
-            estimated_tokens_out=2000,
-        )
-
-        # Should detect "architecture" keyword → complexity 7
-        assert decision.complexity_score == 7
-        assert decision.model == settings.model_medium or decision.model == settings.model_complex
-    finally:
-        settings.llm_routing_enabled = original_routing
-
-
-def test_estimate_cost_calculates_correctly(router):
+    # Simple task but with large token count
+    step = {"title": "Write tests", "complexity": 2}
+    large_tokens = settings.routing_token_threshold_large + 1000
+
+    decision = router.select_model(
+        step,
+        budget_usd=job_with_budget.budget_usd,
+        cost_usd=job_with_budget.cost_usd,
+        estimated_tokens_in=large_tokens,
+        estimated_tokens_out=large_tokens,
+    )
+
+    # Should upgrade from simple to medium
+    assert decision.model == settings.model_medium
+    assert "token_upgrade" in decision.reason
+
+
+def test_estimate_cost_calculates_correctly():
     """Should correctly estimate cost from pricing table"""
-    settings = get_settings()
+    # Own router, so the injected table doesn't leak into the shared router's rate cache
+    router = LLMRouter()
+    router.pricing = PricingTable({"tiny-model": {"input": 0.002, "output": 0.004}})
 
-    # GPT-3.5-turbo: input=0.0005, output=0.0015
-    cost = router._estimate_cost("gpt-3.5-turbo", 1000, 1000)
-    expected = (1000 / 1000) * 0.0005 + (1000 / 1000) * 0.0015
-    assert abs(cost - expected) < 0.0001  # Float comparison
+    cost = router._estimate_cost("tiny-model", 1000, 500)
+    expected = (1000 / 1000) * 0.002 + (500 / 1000) * 0.004
+    assert cost == pytest.approx(expected)
 
 
 def test_complexity_clamped_to_valid_range(router, job_with_budget):
     """Complexity should be clamped to 1-10 range"""
-    settings = get_settings()
-    original_routing = settings.llm_routing_enabled
-    settings.llm_routing_enabled = True
-
-    try:
-        # Invalid complexity > 10
-        step = {"title": "Test", "complexity": 99}
-        decision = router.select_model(
-            step,
-            budget_usd=job_with_budget.budget_usd,
-            cost_usd=job_with_budget.cost_usd,
-            estimated_tokens_in=500,
-            estimated_tokens_out=500,
-        )
-
-        # Should clamp to 10
-        assert decision.complexity_score == 10
-    finally:
-        settings.llm_routing_enabled = original_routing
+    # Invalid complexity > 10
+    step = {"title": "Test", "complexity": 99}
+    decision = router.select_model(
+        step,
+        budget_usd=job_with_budget.budget_usd,
+        cost_usd=job_with_budget.cost_usd,
+        estimated_tokens_in=500,
+        estimated_tokens_out=500,
+    )
+
+    # Should clamp to 10
+    assert decision.complexity_score == 10
+
+
+def test_shared_router_follows_pricing_table(monkeypatch):
+    """Replacing the pricing table rebuilds the shared router, dropping its cached rates"""
+    monkeypatch.setattr(pricing, "_pricing_table", PricingTable({"default": {"input": 1.0, "output": 1.0}}))
+    first = get_router()
+    assert first._estimate_cost("tiny-model", 1000, 0) == pytest.approx(1.0)
+
+    monkeypatch.setattr(pricing, "_pricing_table", PricingTable({"default": {"input": 2.0, "output": 2.0}}))
+    second = get_router()
+
+    assert second is not first
+    assert second._estimate_cost("tiny-model", 1000, 0) == pytest.approx(2.0)
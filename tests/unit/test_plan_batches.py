@@ -0,0 +1,42 @@
+from app.workers.job_worker import _plan_batches
+
+
+def _titles(batches):
+    return [[step["title"] for step in batch] for batch in batches]
+
+
+def test_steps_without_scope_run_alone():
+    plan = [{"title": "a", "files": []}, {"title": "b", "files": []}]
+    assert _titles(_plan_batches(plan, 4)) == [["a"], ["b"]]
+
+
+def test_file_disjoint_steps_are_batched():
+    plan = [
+        {"title": "a", "files": ["app/a.py"]},
+        {"title": "b", "files": ["app/b.py"]},
+        {"title": "c", "files": ["app/a.py"]},
+    ]
+    assert _titles(_plan_batches(plan, 4)) == [["a", "b"], ["c"]]
+
+
+def test_depends_on_splits_batch():
+    plan = [
+        {"title": "a", "files": ["app/a.py"]},
+        {"title": "b", "files": ["app/b.py"], "depends_on": [0]},
+        {"title": "c", "files": ["app/c.py"], "depends_on": []},
+    ]
+    assert _titles(_plan_batches(plan, 4)) == [["a"], ["b", "c"]]
+
+
+def test_empty_depends_on_without_files_runs_alone():
+    plan = [
+        {"title": "a", "files": ["app/a.py"]},
+        {"title": "b", "depends_on": []},
+        {"title": "c", "files": ["app/c.py"]},
+    ]
+    assert _titles(_plan_batches(plan, 4)) == [["a"], ["b"], ["c"]]
+
+
+def test_batch_size_is_capped():
+    plan = [{"title": str(i), "files": [f"f{i}.py"]} for i in range(5)]
+    assert _titles(_plan_batches(plan, 2)) == [["0", "1"], ["2", "3"], ["4"]]
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from app.agents import prompts
+from app.agents.prompts import parse_agents_file
+
+
+def test_parse_agents_file_reuses_spec_until_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompts, "AGENTS_RECHECK_SECONDS", 0.0)
+    path = tmp_path / "AGENTS.md"
+    path.write_text("# CTO-AI\nPlan steps\n", encoding="utf-8")
+
+    first = parse_agents_file(path)
+    assert parse_agents_file(path) is first
+    assert first.section("cto-ai") == "Plan steps"
+
+    path.write_text("# CTO-AI\nPlan smaller steps\n", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    second = parse_agents_file(path)
+    assert second is not first
+    assert second.section("CTO-AI") == "Plan smaller steps"
+    assert second.digest != first.digest
+
+
+def test_parse_agents_file_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        parse_agents_file(tmp_path / "AGENTS.md")
@@ -0,0 +1,53 @@
+from sqlalchemy.orm import Session
+
+from app.db import repo
+from app.db.models import CostEntryModel, MessageSummaryModel
+from app.db.write_buffer import WriteBuffer
+
+
+def _create_job(session: Session):
+    return repo.create_job(
+        session,
+        task="Task",
+        repo_owner="owner",
+        repo_name="repo",
+        branch_base="main",
+        budget_usd=5.0,
+        max_requests=10,
+        max_minutes=30,
+        model_cto=None,
+        model_coder=None,
+        agents_hash=None,
+    )
+
+
+def test_job_totals_update_immediately_and_rows_on_flush(db_session):
+    job = _create_job(db_session)
+    buffer = WriteBuffer()
+
+    buffer.enqueue_cost(db_session, job, provider="p", model="m", tokens_in=10, tokens_out=5, cost_usd=0.25)
+    buffer.enqueue_summary(job_id=job.id, step_id="s1", role="coder-step", summary="done", tokens=5)
+
+    assert job.cost_usd == 0.25
+    assert job.requests_made == 1
+    assert len(buffer) == 2
+    assert db_session.query(CostEntryModel).count() == 0
+
+    buffer.flush(db_session)
+    db_session.commit()
+
+    assert not buffer
+    assert db_session.query(CostEntryModel).one().cost_usd == 0.25
+    summary = db_session.query(MessageSummaryModel).one()
+    assert summary.summary == "done"
+    assert summary.id and summary.created_at
+
+
+def test_should_flush_at_row_limit(db_session):
+    buffer = WriteBuffer(max_rows=2, max_age_seconds=60)
+
+    buffer.enqueue_summary(job_id="job", step_id=None, role="r", summary="a", tokens=1)
+    assert not buffer.should_flush()
+
+    buffer.enqueue_summary(job_id="job", step_id=None, role="r", summary="b", tokens=1)
+    assert buffer.should_flush()